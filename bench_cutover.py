@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import argparse
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import fsutil
+
+
+def unlink_then_link(path, target):
+    # What every updater used to do
+    if path.exists():
+        path.unlink()
+    path.symlink_to(target)
+
+
+METHODS = {
+    'unlink': unlink_then_link,
+    'replace': fsutil.replace_symlink,
+}
+
+
+def hammer(path, stop, counts):
+    # Resolve the link the way a shell exec'ing the tool would
+    while not stop.is_set():
+        try:
+            os.stat(path / 'bin' / 'tool')
+            counts['ok'] += 1
+        except FileNotFoundError:
+            counts['missing'] += 1
+
+
+def run(method, flips, readers):
+    with tempfile.TemporaryDirectory() as root:
+        root = Path(root)
+        targets = []
+        for version in ('1.0.0', '2.0.0'):
+            target = root / f'tool-{version}'
+            (target / 'bin').mkdir(parents=True)
+            (target / 'bin' / 'tool').write_text(version)
+            targets.append(target)
+
+        link = root / 'tool'
+        link.symlink_to(targets[0])
+
+        stop = threading.Event()
+        counts = [{'ok': 0, 'missing': 0} for _ in range(readers)]
+        threads = [
+            threading.Thread(target=hammer, args=(link, stop, count))
+            for count in counts
+        ]
+        for thread in threads:
+            thread.start()
+
+        start = time.monotonic()
+        for flip in range(flips):
+            METHODS[method](link, targets[flip % 2])
+        elapsed = time.monotonic() - start
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        # A dangling link must be replaced as well
+        dangling = root / 'dangling'
+        dangling.symlink_to(root / 'gone')
+        try:
+            METHODS[method](dangling, targets[0])
+            cleans_dangling = dangling.resolve() == targets[0]
+        except FileExistsError:
+            cleans_dangling = False
+
+    return (
+        sum(count['ok'] for count in counts),
+        sum(count['missing'] for count in counts),
+        elapsed,
+        cleans_dangling,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up a symlinked tool while the link is repointed')
+    parser.add_argument('-n', '--flips', type=int, default=20_000)
+    parser.add_argument('-r', '--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f'{"method":<8} {"lookups":>9} {"missing":>8} {"flips/s":>9} dangling')
+    for method in METHODS:
+        ok, missing, elapsed, cleans_dangling = run(method, args.flips, args.readers)
+        print(f'{method:<8} {ok + missing:>9} {missing:>8} {args.flips / elapsed:>9.0f} {"replaced" if cleans_dangling else "failed"}')
+
+
+if __name__ == '__main__':
+    main()
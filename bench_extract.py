@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import os
+import resource
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+import decompress
+import fsutil
+import store
+import unpack
+
+# The real archives the updaters leave in SOFTWARE_ROOT
+DEFAULT_ARCHIVES = (
+    'go*.linux-amd64.tar.gz',
+    'teleport-*-linux-amd64-bin.tar.gz',
+)
+
+
+def write_read(content, path):
+    # What save_member used to do
+    path.write_bytes(content.read())
+
+
+def write_chunked(content, path):
+    unpack.copy_file(content, path)
+
+
+def extract_loop(archive, root, write):
+    # One member at a time, like the original save_member loop
+    files = 0
+    for member in archive:
+        path = root / member.name
+        print(f'{str(path)}')
+        if member.isdir():
+            path.mkdir(parents=True, exist_ok=True)
+        elif member.isfile():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write(archive.extractfile(member), path)
+            unpack.set_metadata(path, member)
+            files += 1
+    return files
+
+
+def extract_parallel(archive, root):
+    files = sum(1 for member in archive.getmembers() if member.isfile())
+    # An empty prefix maps every member name straight under root
+    unpack.extract_all(archive, f'{root}/', '')
+    return files
+
+
+METHODS = {
+    'read': lambda archive, root: extract_loop(archive, root, write_read),
+    'chunked': lambda archive, root: extract_loop(archive, root, write_chunked),
+    'parallel': extract_parallel,
+}
+
+
+def decompress_rate(archive_path, backend):
+    compression = unpack.compression(archive_path)
+    size = 0
+    with archive_path.open('rb') as source:
+        start = time.monotonic()
+        with decompress.open(source, compression, backend=backend) as stream:
+            while chunk := stream.read(decompress.PIPE_BUFFER_SIZE):
+                size += len(chunk)
+        elapsed = time.monotonic() - start
+    return decompress.backend_name(compression, backend), size / elapsed / 1024 / 1024
+
+
+def default_archives():
+    archives = []
+    for pattern in DEFAULT_ARCHIVES:
+        matches = sorted(fsutil.SOFTWARE_ROOT.glob(pattern), key=lambda match: match.stat().st_mtime)
+        if matches:
+            archives.append(matches[-1])
+    return archives
+
+
+def extract(archive_path, method):
+    with tempfile.TemporaryDirectory() as root, tarfile.open(archive_path) as archive:
+        # Load the member index first, so only extraction is timed
+        archive.getmembers()
+        with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+            start = time.monotonic()
+            files = METHODS[method](archive, Path(root))
+            elapsed = time.monotonic() - start
+
+    # Kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{elapsed} {files} {peak_rss}')
+
+
+def measure(archive_path, method):
+    # A fresh interpreter per run, so one method's peak can't hide another's
+    result = subprocess.run(
+        [sys.executable, __file__, '--child', method, str(archive_path)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    elapsed, files, peak_rss = result.stdout.split()
+    return float(elapsed), int(files), int(peak_rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tar member extraction speed and memory')
+    parser.add_argument('archives', nargs='*', type=Path)
+    parser.add_argument('--child', choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Not the real store: it would fill with the benchmark's files, and
+        # the other methods write plain files too
+        store.ENABLED = False
+        extract(args.archives[0], args.child)
+        return
+
+    archives = args.archives or default_archives()
+    if not archives:
+        parser.error(f'no archives given and none found in {fsutil.SOFTWARE_ROOT}')
+
+    print(f'{"archive":<48} {"method":<8} {"seconds":>8} {"files/s":>9} {"peak RSS MiB":>13}')
+    for archive in archives:
+        for method in METHODS:
+            elapsed, files, peak_rss = measure(archive, method)
+            rate = files / elapsed if elapsed else 0
+            print(f'{archive.name:<48} {method:<8} {elapsed:>8.2f} {rate:>9.0f} {peak_rss / 1024:>13.1f}')
+
+    print()
+    print(f'{"archive":<48} {"backend":<8} {"MiB/s out":>9}')
+    for archive in archives:
+        for backend in ('stdlib', 'auto'):
+            name, rate = decompress_rate(archive, backend)
+            print(f'{archive.name:<48} {name:<8} {rate:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import argparse
+import random
+import time
+
+import semver
+
+PRERELEASES = ('alpha', 'alpha.1', 'beta', 'beta.2', 'rc.1', 'rc.10', 'rc1')
+
+
+def make_tags(count, seed):
+    # Roughly what release listings look like: mostly releases, some
+    # pre-releases and build metadata, and plenty of repeats
+    generator = random.Random(seed)
+    tags = []
+    for _ in range(count):
+        tag = f'v{generator.randrange(3)}.{generator.randrange(40)}.{generator.randrange(20)}'
+        if generator.random() < 0.2:
+            tag = f'{tag}-{generator.choice(PRERELEASES)}'
+        if generator.random() < 0.05:
+            tag = f'{tag}+build.{generator.randrange(100)}'
+        tags.append(tag)
+    return tags
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<24} {elapsed:>8.3f} {count / elapsed:>12.0f}')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SemVer parsing and ordering')
+    parser.add_argument('-n', '--count', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tags = make_tags(args.count, args.seed)
+
+    print(f'{"operation":<24} {"seconds":>8} {"tags/s":>12}')
+    timed('parse', args.count, lambda: [semver.SemVer(tag) for tag in tags])
+    semver.parse.cache_clear()
+    timed('parse (memoised, cold)', args.count, lambda: [semver.parse(tag) for tag in tags])
+    versions = timed('parse (memoised, warm)', args.count, lambda: [semver.parse(tag) for tag in tags])
+    timed('sort (operators)', args.count, lambda: sorted(versions))
+    timed('sort (key)', args.count, lambda: sorted(versions, key=lambda version: version.key))
+    latest = timed('max_version', args.count, lambda: semver.max_version(tags))
+    print(f'latest: {latest[0].version}')
+
+
+if __name__ == '__main__':
+    main()
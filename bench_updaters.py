@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+from collections import Counter
+from pathlib import Path
+
+import engine
+import fake_release_server
+import fsutil
+
+# One JSON file per benchmark run, the newest is the baseline for the next
+RESULTS_DIR = fsutil.SOFTWARE_ROOT / '.cache' / 'bench'
+# Every module reads SOFTWARE_ROOT on import, so each install gets a process
+RUNNER = 'import engine, sys; engine.main(sys.argv[1])'
+MIB = 1024 * 1024
+
+# name -> (label, format, whether higher is better)
+COLUMNS = {
+    'download_mib_per_second': ('MiB/s', '{:>8.1f}', True),
+    'extract_files_per_second': ('files/s', '{:>9.0f}', True),
+    'resolve_seconds': ('resolve', '{:>8.3f}', False),
+    'cold_seconds': ('cold', '{:>7.2f}', False),
+    'warm_seconds': ('no-op', '{:>7.2f}', False),
+}
+
+
+def environment(root, manifest, server, stream):
+    env = dict(os.environ)
+    # One tool per process never batches, releases come from REST.
+    # lookups() sets a token to measure the batch.
+    for name in ('GITHUB_TOKEN', 'SOFTWARE_GITHUB_GRAPHQL_URL', 'SOFTWARE_METRICS_LOG', 'SOFTWARE_METRICS_TEXTFILE'):
+        env.pop(name, None)
+    env.update({
+        'SOFTWARE_ROOT': str(root),
+        'SOFTWARE_MANIFEST': str(manifest),
+        'SOFTWARE_GITHUB_API_URL': f'{server.base}/github',
+        'SOFTWARE_METRICS': '1',
+        'NO_PROXY': '127.0.0.1,localhost',
+    })
+    if stream is not None:
+        env['SOFTWARE_STREAM_EXTRACT'] = '1' if stream else '0'
+    return env
+
+
+def install(tool, env):
+    # (wall seconds including interpreter start, the run's metrics record)
+    start = time.monotonic()
+    result = subprocess.run(
+        [sys.executable, '-c', RUNNER, tool],
+        env=env,
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.monotonic() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'{tool}: {result.stderr.strip().splitlines()[-1]}')
+
+    log = Path(env['SOFTWARE_ROOT']) / '.cache' / 'metrics.jsonl'
+    return elapsed, json.loads(log.read_text().splitlines()[-1])
+
+
+def measure(tool, manifest, server, stream):
+    root = Path(tempfile.mkdtemp(prefix=f'bench-{tool}-'))
+    try:
+        env = environment(root, manifest, server, stream)
+        cold, record = install(tool, env)
+        # Everything is in place, this is the path a scheduled run takes
+        warm, _ = install(tool, env)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    phases = record['phases']
+    throughput = record['throughput_bytes_per_second']
+    extract = phases.get('extract')
+    return {
+        'download_mib_per_second': throughput / MIB if throughput else None,
+        'extract_files_per_second': record['files_written'] / extract if extract and record['files_written'] else None,
+        'resolve_seconds': phases.get('resolve'),
+        'cold_seconds': cold,
+        'warm_seconds': warm,
+        'bytes_downloaded': record['bytes_downloaded'],
+        'files_written': record['files_written'],
+    }
+
+
+def lookups(manifest, server, tools):
+    # Resolves every tool at once the way update_all --check does, with a
+    # token so GitHub hosted tools go out as one GraphQL query. The
+    # stand-in answers null for one repository, that one falls back to
+    # REST. The second run should be answered by the index cache.
+    root = Path(tempfile.mkdtemp(prefix='bench-check-'))
+    env = environment(root, manifest, server, None)
+    env['GITHUB_TOKEN'] = 'fake'
+    runs = []
+    try:
+        for _ in range(2):
+            before = Counter(server.hits)
+            start = time.monotonic()
+            result = subprocess.run(
+                [sys.executable, 'update_all.py', '--check', *tools],
+                env=env,
+                cwd=Path(__file__).parent,
+                capture_output=True,
+                text=True,
+            )
+            elapsed = time.monotonic() - start
+            # 1 only means something isn't installed, nothing is here
+            if result.returncode not in (0, 1) or 'failed' in result.stdout:
+                raise RuntimeError(f'update_all --check: {(result.stdout + result.stderr).strip().splitlines()[-1]}')
+            hits = server.hits - before
+            runs.append({
+                'seconds': elapsed,
+                'graphql_requests': hits[fake_release_server.GRAPHQL_PATH],
+                'rest_release_requests': sum(count for path, count in hits.items() if path.endswith('/releases')),
+            })
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return dict(zip(('cold', 'cached'), runs))
+
+
+def median(samples, name):
+    values = [sample[name] for sample in samples if sample[name] is not None]
+    return statistics.median(values) if values else None
+
+
+def summarise(samples):
+    return {name: median(samples, name) for name in samples[0]}
+
+
+def change(current, baseline, higher_is_better):
+    # Positive is worse, so regressions compare the same way in every column
+    if current is None or not baseline:
+        return None
+    ratio = (current - baseline) / baseline
+    return -ratio if higher_is_better else ratio
+
+
+def report(results, baseline, threshold):
+    print(f'{"tool":<12}' + ''.join(f' {label:>{len(fmt.format(0))}}' for label, fmt, _ in COLUMNS.values()))
+    regressions = []
+    for tool, result in results['tools'].items():
+        cells = []
+        for name, (label, fmt, higher_is_better) in COLUMNS.items():
+            value = result[name]
+            cells.append(fmt.format(value) if value is not None else f'{"-":>{len(fmt.format(0))}}')
+        print(f'{tool:<12}' + ''.join(f' {cell}' for cell in cells))
+
+        previous = (baseline or {}).get('tools', {}).get(tool)
+        if previous is None:
+            continue
+        for name, (label, fmt, higher_is_better) in COLUMNS.items():
+            worse = change(result[name], previous.get(name), higher_is_better)
+            if worse is not None and worse > threshold:
+                regressions.append(f'{tool} {label}: {previous[name]:.3f} -> {result[name]:.3f} ({worse:+.0%} worse)')
+
+    if baseline is not None:
+        print(f'\nCompared with {baseline["path"]}')
+        for regression in regressions:
+            print(f'  {regression}')
+        if not regressions:
+            print(f'  no regressions over {threshold:.0%}')
+    return regressions
+
+
+def latest_results():
+    paths = sorted(RESULTS_DIR.glob('updaters-*.json'))
+    return paths[-1] if paths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every updater against a local stand-in for the release servers')
+    parser.add_argument('tools', nargs='*')
+    parser.add_argument('-n', '--runs', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=0.1, help='archive size relative to the real ones')
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, default=None,
+                        help='extract while downloading (default: SOFTWARE_STREAM_EXTRACT)')
+    parser.add_argument('--baseline', type=Path, help='results to compare with (default: the latest saved)')
+    parser.add_argument('--threshold', type=float, default=0.10, help='slowdown that counts as a regression')
+    parser.add_argument('--output', type=Path, help=f'where to save the results (default: {RESULTS_DIR})')
+    args = parser.parse_args()
+
+    with open(engine.MANIFEST_PATH, 'rb') as file:
+        manifest = tomllib.load(file)
+    unknown = sorted(set(args.tools) - set(manifest))
+    if unknown:
+        parser.error(f'unknown tools: {", ".join(unknown)}')
+
+    print('Generating releases...')
+    release = fake_release_server.Release(manifest, args.scale, args.tools or None)
+    server = fake_release_server.Server(release).start()
+    print(f'Serving {release.size / MIB:.0f} MiB on {server.base}')
+
+    baseline_path = args.baseline or latest_results()
+    baseline = None
+    if baseline_path is not None:
+        baseline = json.loads(baseline_path.read_text())
+        baseline['path'] = str(baseline_path)
+        if (baseline['scale'], baseline['stream']) != (args.scale, args.stream):
+            # Different archives or a different pipeline, not comparable
+            print(f'{baseline_path}: measured with other settings, not comparing')
+            baseline = None
+
+    results = {
+        'started': time.time(),
+        'scale': args.scale,
+        'runs': args.runs,
+        'stream': args.stream,
+        'python': sys.version.split()[0],
+        'tools': {},
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        manifest_path = Path(scratch) / 'tools.toml'
+        manifest_path.write_text(fake_release_server.manifest_text(server.manifest))
+        for tool in release.tools:
+            print(f'Benchmarking {tool}...')
+            samples = [measure(tool, manifest_path, server, args.stream) for _ in range(args.runs)]
+            results['tools'][tool] = summarise(samples)
+        print('Resolving every tool at once...')
+        results['check'] = lookups(manifest_path, server, release.tools)
+    server.shutdown()
+
+    output = args.output or RESULTS_DIR / time.strftime('updaters-%Y%m%d-%H%M%S.json')
+    fsutil.write_json(output, results)
+    print()
+    regressions = report(results, baseline, args.threshold)
+    for name, run in results['check'].items():
+        print(f'check, {name}: {run["seconds"]:.2f}s, {run["graphql_requests"]} GraphQL, '
+              f'{run["rest_release_requests"]} REST releases requests')
+    print(f'\nSaved to {output}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
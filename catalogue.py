@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+import download
+import index_cache
+import semver
+
+CATALOGUE_PATH = download.CACHE_DIR / 'catalogue.sqlite3'
+# Resolve versions straight from the upstream indexes when disabled
+ENABLED = os.environ.get('SOFTWARE_CATALOGUE', '1') != '0'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS releases (
+    tool TEXT NOT NULL,
+    version TEXT NOT NULL,
+    sort_key TEXT NOT NULL,
+    prerelease INTEGER NOT NULL,
+    url TEXT,
+    sha256 TEXT,
+    first_seen REAL NOT NULL,
+    PRIMARY KEY (tool, version)
+);
+CREATE INDEX IF NOT EXISTS releases_by_precedence ON releases (tool, prerelease, sort_key);
+CREATE INDEX IF NOT EXISTS releases_by_url ON releases (url);
+CREATE TABLE IF NOT EXISTS refreshes (
+    tool TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL
+);
+'''
+
+UPSERT = '''
+INSERT INTO releases (tool, version, sort_key, prerelease, url, first_seen)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (tool, version) DO UPDATE SET
+    prerelease = excluded.prerelease,
+    url = coalesce(excluded.url, url)
+'''
+
+# Stages run on several threads, sqlite3 connections can't be shared
+_connections = threading.local()
+
+
+def connect():
+    connection = getattr(_connections, 'connection', None)
+    if connection is None:
+        CATALOGUE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(CATALOGUE_PATH, timeout=30, isolation_level=None)
+        # Readers don't block the writer, and concurrent refreshes of
+        # different tools only wait on each other for the commit itself
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        _connections.connection = connection
+    return connection
+
+
+def count(tool):
+    return connect().execute('SELECT count(*) FROM releases WHERE tool = ?', (tool,)).fetchone()[0]
+
+
+def record(tool, releases):
+    # releases: dicts with version, prerelease and optionally url.
+    # Versions that aren't semantic versions can't be ordered, so they
+    # are left out.
+    now = time.time()
+    rows = []
+    for release in releases:
+        try:
+            version = semver.parse(release['version'])
+        except ValueError:
+            continue
+        prerelease = release.get('prerelease') or version.prerelease is not None
+        rows.append((tool, release['version'], semver.sort_text(version), int(prerelease), release.get('url'), now))
+
+    connection = connect()
+    with connection:
+        connection.execute('BEGIN IMMEDIATE')
+        before = count(tool)
+        connection.executemany(UPSERT, rows)
+        connection.execute(
+            'INSERT OR REPLACE INTO refreshes (tool, refreshed_at) VALUES (?, ?)',
+            (tool, now),
+        )
+        return count(tool) - before
+
+
+def record_digest(url, sha256):
+    with connect() as connection:
+        connection.execute('UPDATE releases SET sha256 = ? WHERE url = ?', (sha256, url))
+
+
+def refreshed_at(tool):
+    row = connect().execute('SELECT refreshed_at FROM refreshes WHERE tool = ?', (tool,)).fetchone()
+    return row[0] if row else None
+
+
+def latest(tool, prerelease=False):
+    row = connect().execute(
+        'SELECT version FROM releases WHERE tool = ? AND prerelease <= ? ORDER BY sort_key DESC LIMIT 1',
+        (tool, int(prerelease)),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def newer(tool, version, prerelease=False):
+    # Known releases that outrank version, newest first
+    sort_key = semver.sort_text(semver.parse(version))
+    return [
+        row[0]
+        for row in connect().execute(
+            'SELECT version FROM releases WHERE tool = ? AND prerelease <= ? AND sort_key > ? ORDER BY sort_key DESC',
+            (tool, int(prerelease), sort_key),
+        )
+    ]
+
+
+def releases(tool):
+    return connect().execute(
+        'SELECT version, prerelease, url, sha256, first_seen FROM releases WHERE tool = ? ORDER BY sort_key DESC',
+        (tool,),
+    ).fetchall()
+
+
+def refresh(tool, list_releases):
+    return record(tool, list_releases())
+
+
+def latest_version(tool, list_releases, ttl=None):
+    if not ENABLED:
+        found = semver.max_version(
+            list_releases(),
+            key=lambda release: release['version'],
+            where=lambda release: not release.get('prerelease'),
+            prerelease=False,
+        )
+        if found is None:
+            raise RuntimeError(f"Couldn't find latest {tool} version")
+        return found[1]['version']
+
+    ttl = index_cache.TTL if ttl is None else ttl
+    refreshed = refreshed_at(tool)
+    if refreshed is None or time.time() - refreshed >= ttl:
+        try:
+            refresh(tool, list_releases)
+        except requests.RequestException as e:
+            # Offline: answer from what was seen last time
+            if refreshed is None:
+                raise
+            print(f'{tool}: refresh failed ({e}), using the catalogue from {time.ctime(refreshed)}')
+
+    version = latest(tool)
+    if version is None:
+        raise RuntimeError(f"Couldn't find latest {tool} version")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query or refresh the local release catalogue')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = subparsers.add_parser('refresh', help='record the releases upstream lists now')
+    refresh_parser.add_argument('tools', nargs='*')
+    list_parser = subparsers.add_parser('list', help='print the known releases of a tool')
+    list_parser.add_argument('tool')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for version, prerelease, url, sha256, first_seen in releases(args.tool):
+            flag = 'pre' if prerelease else ''
+            print(f'{version:<24} {flag:<4} {time.strftime("%Y-%m-%d", time.localtime(first_seen))} {sha256 or "-"}')
+        return
+
+    # Imported here, the engine itself resolves through this module
+    import engine
+
+    for name in args.tools or engine.names():
+        tool = engine.tool(name)
+        if not tool.catalogued:
+            continue
+        try:
+            added = refresh(name, tool.releases)
+        except requests.RequestException as e:
+            print(f'{name}: refresh failed ({e})')
+            continue
+        print(f'{name}: {added} new, latest {latest(name)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import os
+
+import requests
+
+import catalogue
+import download
+import fsutil
+import index_cache
+import metrics
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Install unverified when a checksum can't be fetched, instead of failing.
+# optional = true in a tool's checksum table does the same for that tool.
+OPTIONAL = os.environ.get('SOFTWARE_CHECKSUM_OPTIONAL', '0') == '1'
+
+
+class ChecksumUnavailable(Exception):
+    pass
+
+
+class Checksum:
+    # Where upstream publishes the SHA-256 of an artifact: either a
+    # SHA256SUMS style listing (filename given) or a file holding one digest
+    def __init__(self, url, filename=None, optional=False):
+        self.url = url
+        self.filename = filename
+        self.optional = optional
+
+    def __repr__(self):
+        return f'<Checksum {self.url} {self.filename or ""}>'
+
+    async def request(self):
+        return parse_sums(await download.request_text(self.url), self.filename)
+
+
+class GoChecksum(Checksum):
+    # go.dev lists every release file along with its digest
+    def __init__(self, filename, optional=False):
+        super().__init__('https://go.dev/dl/?mode=json&include=all', filename, optional)
+
+    async def request(self):
+        for release in await index_cache.request_json(self.url):
+            for file in release['files']:
+                if file['filename'] == self.filename:
+                    return file['sha256']
+        raise LookupError(f'{self.filename}: not listed in {self.url}')
+
+
+def parse_sums(text, filename=None):
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if filename is None:
+            return fields[0].lower()
+
+        # '<digest>  <name>', or '<digest> *<name>' for binary mode
+        name = fields[-1].lstrip('*')
+        if name == filename or name.endswith(f'/{filename}'):
+            return fields[0].lower()
+
+    raise LookupError(f'{filename}: no checksum listed')
+
+
+async def request_expected(checksum):
+    try:
+        return await checksum.request()
+    except LookupError as e:
+        # The listing came back without the artifact in it: a wrong
+        # checksum.file, or a release published without its digest
+        raise ChecksumUnavailable(f'{checksum.url}: {e}') from e
+    except (requests.RequestException, ValueError) as e:
+        if not (OPTIONAL or checksum.optional):
+            raise ChecksumUnavailable(f'{checksum.url}: could not fetch checksum ({e})') from e
+        print(f'{checksum.url}: could not fetch checksum ({e}), not verifying')
+        return None
+
+
+def start(checksum):
+    # Fetch the expected digest on the download loop, alongside the artifact
+    if checksum is None:
+        return None
+    return asyncio.run_coroutine_threadsafe(request_expected(checksum), download.loop())
+
+
+def sidecar_path(path):
+    return path.with_name(f'{path.name}.verified')
+
+
+def record(path, digest, url=None):
+    if url is not None and catalogue.ENABLED:
+        catalogue.record_digest(url, digest)
+
+    stat = path.stat()
+    fsutil.write_json(sidecar_path(path), {
+        'sha256': digest,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    })
+
+
+def verified_digest(path):
+    # The digest recorded when path was verified, if path hasn't changed since
+    try:
+        verified = json.loads(sidecar_path(path).read_text())
+        stat = path.stat()
+    except (OSError, ValueError):
+        return None
+
+    if verified.get('size') != stat.st_size or verified.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    return verified.get('sha256')
+
+
+def reject(path, expected, digest):
+    path.unlink(missing_ok=True)
+    sidecar_path(path).unlink(missing_ok=True)
+    raise download.ChecksumMismatch(f'{path.name}: expected sha256 {expected}, got {digest}')
+
+
+async def request_save(url, path, checksum=None):
+    # The expected digest is fetched while the artifact downloads
+    expected = asyncio.ensure_future(request_expected(checksum)) if checksum is not None else None
+    digest = await download.stream_to(url, path, sha256=expected)
+    expected = await expected if expected is not None else None
+    if expected is None:
+        return digest
+
+    if digest != expected:
+        reject(path, expected, digest)
+    # Off the download loop: the catalogue write can wait on another
+    # writer's lock, and every transfer in the process runs on the loop
+    await download.blocking(record, path, digest, url)
+    return digest
+
+
+def save(url, path, checksum=None):
+    return download.run(request_save(url, path, checksum))
+
+
+@metrics.timed('hash')
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with path.open('rb') as artifact:
+        while chunk := artifact.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+            metrics.count('bytes_hashed', len(chunk))
+    return hasher.hexdigest()
+
+
+def check(path, checksum):
+    # Cached artifacts are hashed once, after that the sidecar vouches for them
+    if checksum is None or not path.exists() or verified_digest(path):
+        return
+
+    print(f'{path.name}: verifying')
+    expected = start(checksum)
+    digest = hash_file(path)
+    expected = expected.result()
+    if expected is None:
+        return
+
+    if digest != expected:
+        reject(path, expected, digest)
+    record(path, digest)
@@ -0,0 +1,121 @@
+import bz2
+import contextlib
+import gzip
+import lzma
+import os
+import shutil
+import subprocess
+import threading
+
+# 'auto' uses a multi-threaded tool from PATH when there is one,
+# 'stdlib' always decompresses in-process
+BACKEND = os.environ.get('SOFTWARE_DECOMPRESS', 'auto')
+PIPE_BUFFER_SIZE = 1024 * 1024
+
+# compression -> external commands, in order of preference
+COMMANDS = {
+    'gz': (
+        ('pigz', '-dc'),
+    ),
+    'xz': (
+        ('xz', '-dc', '-T0'),
+    ),
+    'zst': (
+        ('zstd', '-dc', '-T0'),
+    ),
+    'bz2': (
+        ('lbzip2', '-dc'),
+        ('pbzip2', '-dc'),
+    ),
+}
+
+STDLIB = {
+    'gz': lambda source: gzip.GzipFile(fileobj=source),
+    'xz': lzma.LZMAFile,
+    'bz2': bz2.BZ2File,
+}
+
+
+class DecompressError(Exception):
+    pass
+
+
+def command(compression, backend=None):
+    if (backend or BACKEND) == 'stdlib':
+        return None
+    for candidate in COMMANDS.get(compression, ()):
+        if shutil.which(candidate[0]):
+            return candidate
+    return None
+
+
+def backend_name(compression, backend=None):
+    found = command(compression, backend)
+    return found[0] if found else 'stdlib'
+
+
+def _pump(source, sink):
+    try:
+        shutil.copyfileobj(source, sink, PIPE_BUFFER_SIZE)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            sink.close()
+        except BrokenPipeError:
+            pass
+
+
+@contextlib.contextmanager
+def _external(argv, source):
+    # A real file is handed to the tool directly, anything else
+    # (e.g. a download being streamed) is pumped through from a thread
+    fileno = None
+    with contextlib.suppress(AttributeError, OSError):
+        fileno = source.fileno()
+
+    process = subprocess.Popen(
+        argv,
+        stdin=fileno if fileno is not None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=PIPE_BUFFER_SIZE,
+    )
+    pump = None
+    if fileno is None:
+        pump = threading.Thread(target=_pump, args=(source, process.stdin), daemon=True)
+        pump.start()
+
+    try:
+        yield process.stdout
+        # Let the tool finish writing whatever the reader left behind
+        while process.stdout.read(PIPE_BUFFER_SIZE):
+            pass
+    finally:
+        process.stdout.close()
+        if pump is not None:
+            pump.join()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise DecompressError(f'{argv[0]} exited {returncode}: {stderr.decode(errors="replace").strip()}')
+
+
+@contextlib.contextmanager
+def open(source, compression, backend=None):
+    if not compression:
+        yield source
+        return
+
+    argv = command(compression, backend)
+    if argv is not None:
+        with _external(argv, source) as stream:
+            yield stream
+        return
+
+    if compression not in STDLIB:
+        raise DecompressError(f'no {compression} decompressor found on PATH')
+    with STDLIB[compression](source) as stream:
+        yield stream
@@ -0,0 +1,749 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+import fsutil
+import metrics
+
+# Reads start small, so a slow link still reports progress, and double
+# while the body arrives faster than CHUNK_FAST_SECONDS per read
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+CHUNK_FAST_SECONDS = 0.05
+CHUNK_SLOW_SECONDS = 0.5
+MAX_CONNECTIONS = 32
+CONNECTIONS_PER_HOST = 8
+CACHE_DIR = fsutil.SOFTWARE_ROOT / '.cache'
+
+# Segmented downloads: 'auto' or a fixed number of connections per file
+SEGMENTS = os.environ.get('SOFTWARE_SEGMENTS', 'auto')
+DEFAULT_SEGMENTS = 4
+MAX_SEGMENTS = CONNECTIONS_PER_HOST
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+# With 'auto', open enough connections to finish in roughly this long
+TARGET_SECONDS = 10
+THROUGHPUT_PATH = CACHE_DIR / 'throughput.json'
+# How often a running download records its progress for resuming
+CHECKPOINT_SECONDS = 1.0
+HASH_CHUNK_SIZE = 1024 * 1024
+# A mirror.py serving this host's fleet, artifacts are asked of it first
+MIRROR = os.environ.get('SOFTWARE_MIRROR', '').rstrip('/')
+# Progress bars: 'auto' draws them only when stdout is a terminal
+PROGRESS = os.environ.get('SOFTWARE_PROGRESS', 'auto')
+PROGRESS_SECONDS = 0.25
+
+_lock = threading.Lock()
+_sessions = {}
+_loop = None
+_throughput = None
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class MirrorMismatch(ChecksumMismatch):
+    # The mirror's copy is bad, upstream's may not be
+    pass
+
+
+def session(url):
+    # One keep-alive pool per host, shared by every updater in the process
+    host = urlparse(url).netloc
+    with _lock:
+        client = _sessions.get(host)
+        if client is None:
+            client = requests.Session()
+            adapter = HTTPAdapter(
+                # Redirect targets (e.g. github.com -> objects.githubusercontent.com)
+                # get their own pool inside the same session
+                pool_connections=4,
+                pool_maxsize=CONNECTIONS_PER_HOST,
+                pool_block=True,
+            )
+            client.mount('http://', adapter)
+            client.mount('https://', adapter)
+            _sessions[host] = client
+    return client
+
+
+def loop():
+    # A single event loop, running on its own thread, drives every fetch
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop.set_default_executor(
+                ThreadPoolExecutor(MAX_CONNECTIONS, thread_name_prefix='download')
+            )
+            threading.Thread(
+                target=_loop.run_forever,
+                name='download-loop',
+                daemon=True,
+            ).start()
+    return _loop
+
+
+def run(coro):
+    return asyncio.run_coroutine_threadsafe(coro, loop()).result()
+
+
+async def blocking(func, *args, **kwargs):
+    # The worker thread runs in the caller's context, like asyncio.to_thread
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, func, *args, **kwargs),
+    )
+
+
+async def request(url, method='GET', **kwargs):
+    response = await blocking(session(url).request, method, url, **kwargs)
+    metrics.http(response.status_code)
+    response.raise_for_status()
+    return response
+
+
+async def request_json(url, **kwargs):
+    response = await request(url, **kwargs)
+    return response.json()
+
+
+async def request_text(url, **kwargs):
+    response = await request(url, **kwargs)
+    return response.text
+
+
+def _load_throughput():
+    global _throughput
+    if _throughput is None:
+        try:
+            _throughput = json.loads(THROUGHPUT_PATH.read_text())
+        except (OSError, ValueError):
+            _throughput = {}
+    return _throughput
+
+
+def record_throughput(url, size, seconds, connections):
+    # Bytes per second achieved by a single connection to this host,
+    # smoothed across downloads and remembered between runs.
+    if size < MIN_SEGMENT_SIZE or seconds <= 0:
+        return
+
+    host = urlparse(url).netloc
+    observed = size / seconds / connections
+    with _lock:
+        throughput = _load_throughput()
+        previous = throughput.get(host)
+        throughput[host] = observed if previous is None else (previous + observed) / 2
+        try:
+            THROUGHPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+            fsutil.write_json(THROUGHPUT_PATH, throughput)
+        except OSError:
+            pass
+
+
+def segment_count(url, size, segments=None):
+    segments = segments or SEGMENTS
+    limit = max(1, min(MAX_SEGMENTS, size // MIN_SEGMENT_SIZE))
+
+    if segments != 'auto':
+        return max(1, min(int(segments), limit))
+
+    with _lock:
+        rate = _load_throughput().get(urlparse(url).netloc)
+    if rate is None:
+        return min(DEFAULT_SEGMENTS, limit)
+
+    return max(1, min(math.ceil(size / (rate * TARGET_SECONDS)), limit))
+
+
+def show_progress():
+    if PROGRESS == 'auto':
+        return sys.stdout.isatty()
+    return PROGRESS != '0'
+
+
+class Progress:
+    # A tqdm bar that redraws at most every PROGRESS_SECONDS, however many
+    # chunks or segment threads report in between, and draws nothing at
+    # all when there is no one watching
+    def __init__(self, total, initial=0):
+        self.bar = tqdm(total=total, initial=initial) if show_progress() else None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.drawn = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, count):
+        if self.bar is None:
+            return
+        with self.lock:
+            self.pending += count
+            now = time.monotonic()
+            if now - self.drawn >= PROGRESS_SECONDS:
+                self.bar.update(self.pending)
+                self.pending = 0
+                self.drawn = now
+
+    def close(self):
+        if self.bar is None:
+            return
+        with self.lock:
+            self.bar.update(self.pending)
+            self.pending = 0
+        self.bar.close()
+
+
+def read_chunks(response):
+    # Yields the body as views of one reused buffer, each valid until the
+    # next is taken. Chunks grow while reads fill quickly, so a fast link
+    # isn't bound by Python iterations, and shrink again when they stall.
+    response.raw.decode_content = True
+    view = memoryview(bytearray(MAX_CHUNK_SIZE))
+    size = MIN_CHUNK_SIZE
+    while True:
+        began = time.monotonic()
+        count = response.raw.readinto(view[:size])
+        if not count:
+            return
+        elapsed = time.monotonic() - began
+        yield view[:count]
+
+        if count == size and elapsed < CHUNK_FAST_SECONDS:
+            size = min(size * 2, MAX_CHUNK_SIZE)
+        elif elapsed > CHUNK_SLOW_SECONDS:
+            size = max(size // 2, MIN_CHUNK_SIZE)
+
+
+def preallocate(fd, offset, length):
+    # Reserve the blocks up front: fewer extents than growing the file a
+    # chunk at a time, and a full disk fails here rather than halfway in
+    if not length or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, offset, length)
+    except OSError:
+        # Filesystems without fallocate (e.g. some network mounts)
+        pass
+
+
+class Transfer:
+    # A download in progress. Bytes land in <name>.part and <name>.part.json
+    # records the validators and how far each segment got, so the next run
+    # can pick up where this one stopped.
+    def __init__(self, url, path):
+        self.url = url
+        self.path = path
+        self.part = path.with_name(f'{path.name}.part')
+        self.sidecar = path.with_name(f'{path.name}.part.json')
+        self.lock = threading.Lock()
+        self.changed = threading.Condition()
+        self.failed = False
+        self.etag = None
+        self.last_modified = None
+        self.size = None
+        # [start, end, received] per segment, end is None when unknown
+        self.segments = []
+        self.checkpointed = 0.0
+
+    def load(self, headers):
+        content_length = headers.get('content-length')
+        self.etag = headers.get('etag')
+        self.last_modified = headers.get('last-modified')
+        self.size = int(content_length) if content_length else None
+
+        try:
+            state = json.loads(self.sidecar.read_text())
+        except (OSError, ValueError):
+            return False
+
+        # Only resume if the server can tell us it is still the same file
+        if (
+            self.part.exists()
+            and (self.etag or self.last_modified)
+            and state.get('url') == self.url
+            and state.get('etag') == self.etag
+            and state.get('last_modified') == self.last_modified
+            and state.get('size') == self.size
+        ):
+            self.segments = state['segments']
+        return bool(self.segments)
+
+    @property
+    def validator(self):
+        return self.etag or self.last_modified
+
+    @property
+    def received(self):
+        return sum(received for _, _, received in self.segments)
+
+    @property
+    def contiguous(self):
+        # Bytes from the start of the file that have all been written
+        offset = 0
+        for start, end, received in self.segments:
+            if start != offset:
+                break
+            offset = start + received
+            if end is None or offset <= end:
+                break
+        return offset
+
+    def advance(self, segment, count):
+        with self.changed:
+            segment[2] += count
+            self.changed.notify_all()
+        self.checkpoint()
+
+    def fail(self):
+        with self.changed:
+            self.failed = True
+            self.changed.notify_all()
+
+    def checkpoint(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.checkpointed < CHECKPOINT_SECONDS:
+                return
+            self.checkpointed = now
+            fsutil.write_json(self.sidecar, {
+                'url': self.url,
+                'etag': self.etag,
+                'last_modified': self.last_modified,
+                'size': self.size,
+                'segments': [list(segment) for segment in self.segments],
+            })
+
+    def complete(self):
+        os.replace(self.part, self.path)
+        self.sidecar.unlink(missing_ok=True)
+
+
+def mirror_url(url):
+    # http://mirror/https/go.dev/dl/go1.22.1.linux-amd64.tar.gz
+    parts = urlsplit(url)
+    query = f'?{parts.query}' if parts.query else ''
+    return f'{MIRROR}/{parts.scheme}/{parts.netloc}{parts.path}{query}'
+
+
+def _probe(url):
+    # Follow redirects once, so the segments all hit the final CDN URL
+    try:
+        response = session(url).head(url, allow_redirects=True)
+    except requests.RequestException:
+        return url, {}
+    metrics.http(response.status_code)
+    if not response.ok:
+        return url, {}
+    return response.url, response.headers
+
+
+def _hash_prefix(path, size, hasher):
+    with path.open('rb') as resumed:
+        while size:
+            chunk = resumed.read(min(size, 1024 * 1024))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            size -= len(chunk)
+
+
+def _stream_to(transfer, url):
+    hasher = hashlib.sha256()
+    if len(transfer.segments) != 1:
+        transfer.segments = []
+    received = transfer.received
+
+    headers = {}
+    if received:
+        headers = {'Range': f'bytes={received}-', 'If-Range': transfer.validator}
+        print(f'Resuming: {url} from {received} bytes')
+    else:
+        print(f'Downloading: {url}')
+
+    start = time.monotonic()
+    with session(url).get(url, headers=headers, stream=True) as download:
+        metrics.http(download.status_code)
+        download.raise_for_status()
+        if download.status_code != 206:
+            # The server sent the whole file, start over
+            received = 0
+
+        content_length = download.headers.get('content-length')
+        total = received + int(content_length) if content_length else None
+        segment = [0, total - 1 if total else None, received]
+        transfer.segments = [segment]
+
+        if received:
+            _hash_prefix(transfer.part, received, hasher)
+
+        with transfer.part.open('r+b' if received else 'wb') as saved, \
+             Progress(total, received) as progress:
+            saved.seek(received)
+            saved.truncate()
+            if total is not None:
+                preallocate(saved.fileno(), received, total - received)
+            for chunk in read_chunks(download):
+                progress.update(len(chunk))
+                hasher.update(chunk)
+                saved.write(chunk)
+                transfer.advance(segment, len(chunk))
+
+    if total is not None and segment[2] != total:
+        transfer.checkpoint(force=True)
+        raise IOError(f'{url}: received {segment[2]} of {total} bytes')
+
+    elapsed = time.monotonic() - start
+    record_throughput(download.url, segment[2] - received, elapsed, 1)
+    metrics.count('bytes_downloaded', segment[2] - received)
+    metrics.count('download_seconds', elapsed)
+    transfer.complete()
+    return hasher.hexdigest()
+
+
+def _hash_as_written(transfer, hasher):
+    # Segments arrive out of order, so hash the file as the written
+    # prefix grows. Those pages were just written and are still cached.
+    # pread, not a buffered file: a buffered read would read ahead past the
+    # watermark and hand back those bytes as they were before the
+    # segment writing them got there.
+    offset = 0
+    fd = os.open(transfer.part, os.O_RDONLY)
+    try:
+        while offset < transfer.size:
+            with transfer.changed:
+                transfer.changed.wait_for(
+                    lambda: transfer.failed or transfer.contiguous > offset
+                )
+                if transfer.failed:
+                    return
+                watermark = transfer.contiguous
+
+            while offset < watermark:
+                chunk = os.pread(fd, min(watermark - offset, HASH_CHUNK_SIZE), offset)
+                if not chunk:
+                    raise IOError(f'{transfer.part}: shorter than recorded')
+                hasher.update(chunk)
+                offset += len(chunk)
+    finally:
+        os.close(fd)
+
+
+def _fetch_range(transfer, url, fd, segment, progress):
+    start, end, received = segment
+    if start + received > end:
+        return
+
+    headers = {'Range': f'bytes={start + received}-{end}'}
+    if transfer.validator:
+        headers['If-Range'] = transfer.validator
+
+    with session(url).get(url, headers=headers, stream=True) as response:
+        metrics.http(response.status_code)
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RangeNotSupported(f'{url}: {response.status_code} for a range request')
+
+        offset = start + received
+        for chunk in read_chunks(response):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+            progress.update(len(chunk))
+            transfer.advance(segment, len(chunk))
+    metrics.count('bytes_downloaded', offset - start - received)
+
+    if offset != end + 1:
+        raise IOError(f'{url}: segment {start}-{end} ended at {offset}')
+
+
+async def _segmented(transfer, url, count):
+    size = transfer.size
+    if transfer.segments:
+        print(f'Resuming: {url} from {transfer.received} bytes ({len(transfer.segments)} segments)')
+    else:
+        print(f'Downloading: {url} ({count} segments)')
+        step = math.ceil(size / count)
+        transfer.segments = [
+            [start, min(start + step, size) - 1, 0]
+            for start in range(0, size, step)
+        ]
+
+    resumed = transfer.received
+    start = time.monotonic()
+    hasher = hashlib.sha256()
+    fd = os.open(transfer.part, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        preallocate(fd, 0, size)
+        hashing = asyncio.ensure_future(blocking(_hash_as_written, transfer, hasher))
+        with Progress(size, resumed) as progress:
+            # Let every segment finish before closing the shared descriptor
+            results = await asyncio.gather(*(
+                blocking(_fetch_range, transfer, url, fd, segment, progress)
+                for segment in transfer.segments
+            ), return_exceptions=True)
+    finally:
+        os.close(fd)
+        transfer.checkpoint(force=True)
+
+    for result in results:
+        if isinstance(result, BaseException):
+            transfer.fail()
+            await asyncio.gather(hashing, return_exceptions=True)
+            raise result
+    await hashing
+
+    elapsed = time.monotonic() - start
+    record_throughput(url, size - resumed, elapsed, len(transfer.segments))
+    metrics.count('download_seconds', elapsed)
+    transfer.complete()
+    return hasher.hexdigest()
+
+
+async def stream_to(url, path, segments=None, sha256=None):
+    # Saves url to path and returns the SHA-256 of what was saved. Only the
+    # artifact comes from the mirror, checksums are still fetched upstream.
+    # sha256 is a task resolving to the expected digest (or to None), a
+    # mirrored copy that doesn't match it is downloaded again from
+    # upstream. Checking upstream's copy is up to the caller.
+    if MIRROR:
+        try:
+            digest = await _stream_from(mirror_url(url), path, segments)
+        except requests.RequestException as e:
+            print(f'{MIRROR}: {e}, downloading from upstream')
+        else:
+            expected = await sha256 if sha256 is not None else None
+            if expected is None or digest == expected:
+                return digest
+            print(f'{MIRROR}: {path.name} fails verification, downloading from upstream')
+            path.unlink(missing_ok=True)
+    return await _stream_from(url, path, segments)
+
+
+def segmented(url, path, segments=None):
+    # Whether saving url to path would split it across connections, which
+    # a reader taking the body front to back can't do
+    source = mirror_url(url) if MIRROR else url
+    final_url, headers = _probe(source)
+    if 'bytes' not in headers.get('accept-ranges', '').lower():
+        return False
+
+    transfer = Transfer(source, path)
+    transfer.load(headers)
+    if not transfer.size:
+        return False
+    resumed = len(transfer.segments) > 1
+    return resumed or (segment_count(final_url, transfer.size, segments) > 1 and not transfer.segments)
+
+
+async def _stream_from(url, path, segments):
+    transfer = Transfer(url, path)
+    final_url, headers = await blocking(_probe, url)
+    transfer.load(headers)
+
+    ranges = 'bytes' in headers.get('accept-ranges', '').lower()
+    if ranges and transfer.size:
+        resumed = len(transfer.segments) > 1
+        count = segment_count(final_url, transfer.size, segments)
+        if resumed or (count > 1 and not transfer.segments):
+            try:
+                return await _segmented(transfer, final_url, count)
+            except RangeNotSupported:
+                transfer.segments = []
+
+    return await blocking(_stream_to, transfer, url)
+
+
+class Tee(io.RawIOBase):
+    # Hands the response body to a reader (e.g. a tarfile stream) while
+    # saving it to the .part file and hashing it on the way through.
+    # A resumed download replays the bytes already on disk first.
+    def __init__(self, transfer, response, received, hasher, progress):
+        self.transfer = transfer
+        self.hasher = hasher
+        self.progress = progress
+        self.chunks = read_chunks(response)
+        self.pending = b''
+
+        self.replay = transfer.part.open('rb') if received else None
+        self.replay_left = received
+        self.saved = transfer.part.open('r+b' if received else 'wb')
+        self.saved.seek(received)
+        self.saved.truncate()
+
+        total = transfer.segments[0][1]
+        if total is not None:
+            preallocate(self.saved.fileno(), received, total + 1 - received)
+        self.segment = [0, total, received]
+        transfer.segments = [self.segment]
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)
+
+        if self.replay_left:
+            count = self.replay.readinto(view[:min(len(view), self.replay_left)])
+            if not count:
+                raise IOError(f'{self.transfer.part}: shorter than recorded')
+            self.hasher.update(view[:count])
+            self.replay_left -= count
+            return count
+
+        if not self.pending:
+            self.pending = next(self.chunks, b'')
+            if not self.pending:
+                return 0
+            self.saved.write(self.pending)
+            self.hasher.update(self.pending)
+            self.progress.update(len(self.pending))
+            self.transfer.advance(self.segment, len(self.pending))
+
+        count = min(len(view), len(self.pending))
+        view[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+    def drain(self):
+        # Readers stop at the end of the archive, the file may carry padding
+        buffer = bytearray(MIN_CHUNK_SIZE)
+        while self.readinto(buffer):
+            pass
+
+    def close(self):
+        if self.replay is not None:
+            self.replay.close()
+        self.saved.close()
+        super().close()
+
+
+def _open_stream(url, path):
+    # (transfer, response, bytes of it already on disk)
+    transfer = Transfer(url, path)
+    _, headers = _probe(url)
+    transfer.load(headers)
+    if len(transfer.segments) != 1:
+        transfer.segments = []
+
+    received = transfer.received
+    request_headers = {}
+    if received:
+        request_headers = {'Range': f'bytes={received}-', 'If-Range': transfer.validator}
+        print(f'Resuming: {url} from {received} bytes')
+    else:
+        print(f'Downloading: {url}')
+
+    response = session(url).get(url, headers=request_headers, stream=True)
+    metrics.http(response.status_code)
+    try:
+        response.raise_for_status()
+    except requests.RequestException:
+        response.close()
+        raise
+    if response.status_code != 206:
+        received = 0
+    return transfer, response, received
+
+
+@contextlib.contextmanager
+def open_stream(url, path, sha256=None, on_verified=None, mirror=True):
+    # sha256 is the expected digest, or a future that resolves to it
+    # (or to None) while the download is running. Once the reader has
+    # started the source is fixed, so the mirror can only be passed over
+    # before that, bad bytes from it raise MirrorMismatch for the caller
+    # to start again with mirror=False.
+    start = time.monotonic()
+    opened = None
+    if MIRROR and mirror:
+        try:
+            opened = _open_stream(mirror_url(url), path)
+        except requests.RequestException as e:
+            print(f'{MIRROR}: {e}, downloading from upstream')
+    transfer, response, received = opened or _open_stream(url, path)
+    url = transfer.url
+
+    with response:
+        content_length = response.headers.get('content-length')
+        total = received + int(content_length) if content_length else None
+        transfer.segments = [[0, total - 1 if total else None, received]]
+
+        hasher = hashlib.sha256()
+        with Progress(total, received) as progress:
+            tee = Tee(transfer, response, received, hasher, progress)
+            try:
+                yield io.BufferedReader(tee, MIN_CHUNK_SIZE)
+                tee.drain()
+            except BaseException:
+                transfer.checkpoint(force=True)
+                raise
+            finally:
+                tee.close()
+
+    if total is not None and tee.segment[2] != total:
+        transfer.checkpoint(force=True)
+        raise IOError(f'{url}: received {tee.segment[2]} of {total} bytes')
+    # Includes the time the reader spent on each chunk, which is the point
+    # of streaming: the download took as long as the extraction let it
+    metrics.count('bytes_downloaded', tee.segment[2] - received)
+    metrics.count('download_seconds', time.monotonic() - start)
+
+    digest = hasher.hexdigest()
+    if hasattr(sha256, 'result'):
+        try:
+            sha256 = sha256.result()
+        except BaseException:
+            # Nothing says the bytes are bad, the next run verifies them
+            transfer.complete()
+            raise
+    if sha256 is not None and digest != sha256:
+        transfer.part.unlink(missing_ok=True)
+        transfer.sidecar.unlink(missing_ok=True)
+        mismatch = MirrorMismatch if opened is not None else ChecksumMismatch
+        raise mismatch(f'{url}: expected sha256 {sha256}, got {digest}')
+
+    transfer.complete()
+    if sha256 is not None and on_verified is not None:
+        on_verified(digest)
+
+
+# Blocking wrappers for the updaters
+
+def get(url, **kwargs):
+    return run(request(url, **kwargs))
+
+
+def get_json(url, **kwargs):
+    return run(request_json(url, **kwargs))
+
+
+def get_text(url, **kwargs):
+    return run(request_text(url, **kwargs))
+
+
+def save(url, path, segments=None):
+    return run(stream_to(url, path, segments))
@@ -0,0 +1,273 @@
+import functools
+import os
+import re
+import subprocess
+import tarfile
+import tomllib
+import zipfile
+from pathlib import Path
+from urllib.parse import urlparse
+
+import catalogue
+import checksums
+import download
+import fsutil
+import github
+import index_cache
+import metrics
+import unpack
+
+MANIFEST_PATH = Path(os.environ.get('SOFTWARE_MANIFEST', Path(__file__).with_name('tools.toml')))
+
+# Index sources that list every release, so they go through the catalogue
+CATALOGUED = ('github', 'json-list')
+
+
+@functools.cache
+def manifest():
+    with open(MANIFEST_PATH, 'rb') as file:
+        return tomllib.load(file)
+
+
+def names():
+    # Biggest artifacts first, so the run is bounded by the slowest download
+    # rather than by whatever happens to be scheduled last.
+    tools = manifest()
+    return sorted(tools, key=lambda name: (tools[name].get('priority', len(tools)), name))
+
+
+@functools.cache
+def tool(name):
+    try:
+        spec = manifest()[name]
+    except KeyError:
+        raise LookupError(f'{name}: not in {MANIFEST_PATH}') from None
+    return Tool(name, spec)
+
+
+class Tool:
+    # One manifest entry, with the stages the pipeline runs
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self.index = spec['index']
+        self.layout = spec['layout']
+        self.repo = self.index.get('repo')
+        # version -> artifact URL, for indexes that hand out the URL themselves
+        self.locations = {}
+        # Versions fetch() found already installed, the later stages skip them
+        self.installed = set()
+
+    def __repr__(self):
+        return f'<Tool {self.name}>'
+
+    def path(self, key, version=None):
+        return fsutil.SOFTWARE_ROOT / Path(self.spec[key].format(version=version)).expanduser()
+
+    def fetch_url(self, version):
+        return self.locations.get(version) or self.spec['url'].format(version=version)
+
+    @property
+    def catalogued(self):
+        return self.index['source'] in CATALOGUED
+
+    def releases(self):
+        source = self.index['source']
+        if source == 'github':
+            field = self.index.get('field', 'tag_name')
+            prefix = self.index.get('strip_prefix', '')
+            return github.catalogue_entries(
+                self.repo,
+                lambda entry: entry[field].removeprefix(prefix),
+                self.spec['url'],
+            )
+
+        if source == 'json-list':
+            field = self.index.get('version', 'version')
+            stable = self.index.get('stable')
+            return [
+                {
+                    'version': entry[field],
+                    'prerelease': stable is not None and not entry[stable],
+                    'url': self.fetch_url(entry[field]),
+                }
+                for entry in index_cache.get_json(self.index['url'])
+            ]
+
+        raise ValueError(f'{self.name}: {source} indexes only name the latest version')
+
+    def latest_version(self):
+        source = self.index['source']
+        if source in CATALOGUED:
+            return catalogue.latest_version(self.name, self.releases)
+
+        if source == 'text':
+            return index_cache.get_text(self.index['url']).strip()
+
+        if source == 'json':
+            value = index_cache.get_json(self.index['url'])
+            for key in self.index['path'].split('.'):
+                value = value[key]
+            return value
+
+        if source == 'redirect':
+            redirect = download.get(self.index['url'], allow_redirects=False)
+            location = redirect.headers['location']
+            name = Path(urlparse(location).path).name
+            version = re.fullmatch(self.index['pattern'], name)['version']
+            self.locations[version] = location
+            return version
+
+        raise ValueError(f'{self.name}: unknown index source {source}')
+
+    def checksum(self, version):
+        spec = self.spec.get('checksum')
+        if spec is None:
+            return None
+
+        filename = spec['file'].format(version=version) if 'file' in spec else None
+        optional = spec.get('optional', False)
+        if spec.get('source') == 'go':
+            return checksums.GoChecksum(filename, optional)
+        return checksums.Checksum(spec['url'].format(version=version), filename, optional)
+
+    @metrics.timed('resolve')
+    def resolve(self):
+        return self.latest_version()
+
+    def is_installed(self, version):
+        # A finished tree carries a completion marker naming the archive it
+        # came from, and a member is renamed into place whole
+        if self.layout == 'tree':
+            return unpack.is_complete(self.path('root', version), self.path('file', version))
+        if self.layout == 'member':
+            return self.path('target', version).exists()
+        return False
+
+    @metrics.timed('fetch')
+    def fetch(self, version):
+        artifact = self.path('file', version)
+        if self.is_installed(version):
+            self.installed.add(version)
+            return artifact
+
+        if self.layout == 'tree':
+            missing = unpack.needs_download(self.fetch_url(version), artifact)
+        else:
+            missing = not artifact.exists()
+
+        if missing:
+            artifact.parent.mkdir(parents=True, exist_ok=True)
+            checksums.save(self.fetch_url(version), artifact, self.checksum(version))
+        return artifact
+
+    @metrics.timed('verify')
+    def verify(self, version, artifact):
+        if version in self.installed:
+            return
+        checksums.check(artifact, self.checksum(version))
+
+    @metrics.timed('extract')
+    def extract(self, version, artifact):
+        if self.layout == 'tree':
+            root = self.path('root', version)
+            if version in self.installed:
+                return root
+
+            try:
+                self.extract_tree(version, artifact, root)
+            except download.MirrorMismatch as e:
+                # What the mirror streamed in was thrown away with the tree
+                print(f'{e}, downloading from upstream')
+                self.extract_tree(version, artifact, root, mirror=False)
+            return root
+
+        if self.layout == 'member':
+            target = self.path('target', version)
+            if version in self.installed:
+                return target
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Written aside and renamed, so target is never half a binary
+            staging = target.with_name(f'.{target.name}.staging')
+            member = self.spec['member'].format(version=version)
+            if zipfile.is_zipfile(artifact):
+                with zipfile.ZipFile(artifact) as archive, archive.open(member) as source:
+                    unpack.copy_file(source, staging)
+            else:
+                with tarfile.open(artifact) as archive:
+                    unpack.copy_file(archive.extractfile(member), staging)
+            staging.chmod(0o755)
+            os.replace(staging, target)
+            metrics.count('files_written')
+            metrics.count('bytes_written', target.stat().st_size)
+            return target
+
+        if self.layout == 'binary':
+            artifact.chmod(0o755)
+            return artifact
+
+        if self.layout == 'deb':
+            subprocess.run(['sudo', 'dpkg', '-i', str(artifact)], check=True, capture_output=True)
+            return None
+
+        raise ValueError(f'{self.name}: unknown layout {self.layout}')
+
+    def extract_tree(self, version, artifact, root, mirror=True):
+        prefix = self.spec['prefix'].format(version=version)
+        with unpack.staged(root) as staging:
+            with unpack.open_tarball(self.fetch_url(version), artifact, self.checksum(version), mirror) as archive:
+                members, total_bytes = unpack.extract_all(archive, staging.path, prefix, journal=staging)
+            # The digest is known once the archive has been read to the end
+            staging.summary = {
+                'sha256': checksums.verified_digest(artifact),
+                'members': members,
+                'bytes': total_bytes,
+            }
+        print(f'Extracted {members} members to {root}')
+
+    def link_target_key(self):
+        for key in ('link_target', 'root', 'target', 'file'):
+            if key in self.spec:
+                return key
+
+    @metrics.timed('link')
+    def link(self, version, installed):
+        if 'link' not in self.spec:
+            return
+
+        fsutil.replace_symlink(self.path('link'), self.path(self.link_target_key(), version))
+
+    def installed_version(self):
+        if self.layout == 'deb':
+            return installed_package(self.spec['package'])
+        if 'link' not in self.spec:
+            return None
+
+        # The version is whatever {version} stood for in the link target's name
+        name = Path(self.spec[self.link_target_key()]).name
+        prefix, _, suffix = name.partition('{version}')
+        return fsutil.link_version(self.path('link'), prefix, suffix)
+
+    def main(self):
+        with metrics.measure(self.name):
+            version = self.resolve()
+            artifact = self.fetch(version)
+            self.verify(version, artifact)
+            installed = self.extract(version, artifact)
+            self.link(version, installed or artifact)
+
+
+def installed_package(package):
+    try:
+        result = subprocess.run(
+            ['dpkg-query', '--show', '--showformat=${Version}', package],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def main(name):
+    tool(name).main()
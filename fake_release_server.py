@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+import argparse
+import copy
+import hashlib
+import http.server
+import io
+import json
+import random
+import re
+import tarfile
+import threading
+import tomllib
+import zipfile
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import engine
+
+MIB = 1024 * 1024
+
+# Newest last. The pre-release is the highest version, so an index that
+# doesn't tell them apart installs the wrong one.
+RELEASES = (
+    ('1.8.2', False),
+    ('1.9.0', False),
+    ('1.9.1', False),
+    ('2.0.0-rc.1', True),
+)
+LATEST = '1.9.1'
+# What the redirect index names, vscode style
+BUILD = '1700000000'
+
+# Archive shapes at --scale 1, close to the real thing
+SHAPES = {
+    # go: ~12k sources, a few hundred directories. --scale cuts the count.
+    'small-files': {'files': 12_000, 'size': 16 * 1024, 'per_dir': 40, 'scales': 'files'},
+    # teleport: tsh, tctl, teleport and tbot. --scale cuts the size.
+    'huge-binaries': {'files': 4, 'size': 100 * MIB, 'per_dir': 4, 'scales': 'size'},
+}
+TOOL_SHAPES = {'teleport': 'huge-binaries'}
+# Single executables, whether bare or in an archive
+BINARY_SIZE = 40 * MIB
+
+GRAPHQL_PATH = '/github/graphql'
+# alias: repository(owner: "...", name: "...") in a batched query
+REPOSITORY_QUERY = re.compile(r'(\w+): repository\(owner: ("(?:[^"\\]|\\.)*"), name: ("(?:[^"\\]|\\.)*")\)')
+
+
+def version_for(tool, release):
+    # GitHub tags carry a 'v' unless the index strips it, node's index has
+    # one and go's doesn't
+    index = tool['index']
+    if index['source'] == 'github' and not index.get('strip_prefix'):
+        return f'v{release}'
+    if index['source'] == 'json-list' and index.get('stable') == 'lts':
+        return f'v{release}'
+    return release
+
+
+def content(rng, size):
+    # About as compressible as a real binary: half noise, half padding
+    noise = size // 2
+    return rng.randbytes(noise) + bytes(size - noise)
+
+
+def add_file(archive, name, data, mode=0o644):
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    member.mode = mode
+    member.mtime = 1_700_000_000
+    archive.addfile(member, io.BytesIO(data))
+
+
+def tarball(url, files, links=()):
+    mode = 'w:xz' if url.endswith('.xz') else 'w:gz'
+    buffer = io.BytesIO()
+    options = {'preset': 1} if mode == 'w:xz' else {'compresslevel': 1}
+    with tarfile.open(fileobj=buffer, mode=mode, **options) as archive:
+        for name, data, file_mode in files:
+            add_file(archive, name, data, file_mode)
+        for name, target in links:
+            member = tarfile.TarInfo(name)
+            member.type = tarfile.SYMTYPE
+            member.linkname = target
+            archive.addfile(member)
+    return buffer.getvalue()
+
+
+def zip_archive(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for name, data, _ in files:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tree_files(rng, prefix, shape, scale):
+    shape = SHAPES[shape]
+    files, size = shape['files'], shape['size']
+    if shape['scales'] == 'files':
+        files = max(1, int(files * scale))
+    else:
+        size = max(MIB, int(size * scale))
+    entries = [
+        (f'{prefix}/lib/d{index // shape["per_dir"]:03d}/f{index:05d}', content(rng, size), 0o644)
+        for index in range(files - 1)
+    ]
+    entries.append((f'{prefix}/bin/tool', content(rng, size), 0o755))
+    return entries, [(f'{prefix}/bin/tool-link', 'tool')]
+
+
+def artifact(name, tool, url, version, scale):
+    rng = random.Random(f'{name} {version}')
+    layout = tool['layout']
+    if layout == 'tree':
+        prefix = tool['prefix'].format(version=version)
+        files, links = tree_files(rng, prefix, TOOL_SHAPES.get(name, 'small-files'), scale)
+        return tarball(url, files, links)
+
+    binary = content(rng, max(MIB, int(BINARY_SIZE * scale)))
+    if layout == 'binary':
+        return binary
+
+    files = [
+        (tool['member'].format(version=version), binary, 0o755),
+        ('LICENSE', b'Synthetic release for benchmarking\n', 0o644),
+        ('README.md', b'# Not a real release\n', 0o644),
+    ]
+    if url.endswith('.zip'):
+        return zip_archive(files)
+    return tarball(url, files)
+
+
+class Release:
+    # Everything the stand-in serves, keyed by request path
+    def __init__(self, manifest, scale=0.1, tools=None):
+        self.manifest = manifest
+        self.scale = scale
+        self.tools = [
+            name for name in (tools or manifest)
+            # dpkg needs root, there is nothing to measure without it
+            if manifest[name]['layout'] != 'deb'
+        ]
+        self.base = None
+        self.files = {}
+        # Artifacts go out as application/octet-stream
+        self.types = {}
+        self.redirects = {}
+        # repo -> releases, for GraphQL
+        self.repositories = {}
+        # GitHub answers null for a repository the token can't see. The
+        # stand-in does that for one, so the REST fallback runs as well.
+        self.hidden = None
+
+    def path(self, url):
+        # https://host/path -> /host/path on the stand-in
+        parts = urlsplit(url)
+        return f'/{parts.netloc}{parts.path}'
+
+    def local(self, url):
+        return f'{self.base}{self.path(url)}'
+
+    def serve_json(self, path, value):
+        self.files[path] = json.dumps(value).encode()
+        self.types[path] = 'application/json'
+
+    def serve_text(self, path, text):
+        # Without a charset requests guesses, and guesses wrong on a version
+        self.files[path] = text.encode()
+        self.types[path] = 'text/plain; charset=utf-8'
+
+    def build(self, base):
+        # Returns the manifest rewritten to point at base
+        self.base = base
+        rewritten = {}
+        for name in self.tools:
+            tool = copy.deepcopy(self.manifest[name])
+            index = tool['index']
+            latest = version_for(tool, LATEST)
+
+            if index['source'] == 'redirect':
+                latest = BUILD
+                location = f'/redirect/{name}/{name}-{BUILD}.tar.gz'
+                index['pattern'] = rf'{re.escape(name)}-(?P<version>\d+)\.tar\.gz'
+                index['url'] = f'{base}/redirect/{name}'
+                tool['url'] = f'{base}{location}'
+                self.redirects[f'/redirect/{name}'] = location
+            else:
+                tool['url'] = self.local(tool['url'])
+
+            if index['source'] == 'github':
+                releases = [
+                    {
+                        'name': version_for(tool, release),
+                        'tag_name': version_for(tool, release),
+                        'draft': False,
+                        'prerelease': prerelease,
+                    }
+                    for release, prerelease in reversed(RELEASES)
+                ]
+                self.serve_json(f'/github/repos/{index["repo"]}/releases', releases)
+                self.repositories[index['repo']] = releases
+                self.hidden = index['repo']
+            elif index['source'] == 'json-list':
+                field = index.get('version', 'version')
+                stable = index.get('stable', 'stable')
+                index['url'] = self.local(index['url'])
+                self.serve_json(urlsplit(index['url']).path, [
+                    # node's index.json has 'lts': 'Iron' or false
+                    {field: version_for(tool, release), stable: not prerelease, 'files': []}
+                    for release, prerelease in reversed(RELEASES)
+                ])
+            elif index['source'] == 'json':
+                index['url'] = self.local(index['url'])
+                value = latest
+                for key in reversed(index['path'].split('.')):
+                    value = {key: value}
+                self.serve_json(urlsplit(index['url']).path, value)
+            elif index['source'] == 'text':
+                index['url'] = self.local(index['url'])
+                self.serve_text(urlsplit(index['url']).path, f'{latest}\n')
+
+            url = tool['url'].format(version=latest)
+            data = artifact(name, tool, url, latest, self.scale)
+            self.files[urlsplit(url).path] = data
+
+            checksum = tool.get('checksum')
+            if checksum is not None:
+                digest = hashlib.sha256(data).hexdigest()
+                if checksum.get('source') == 'go':
+                    # go.dev isn't mirrored, a listing stands in for it
+                    del checksum['source']
+                    checksum['url'] = f'https://go.dev/dl/{name}-{{version}}.sha256sums'
+                checksum['url'] = self.local(checksum['url'])
+                if 'file' in checksum:
+                    # A listing, with a neighbour to skip over
+                    listed = checksum['file'].format(version=latest)
+                    decoy = hashlib.sha256(listed.encode()).hexdigest()
+                    sums = f'{decoy}  {listed}.sig\n{digest}  {listed}\n'
+                else:
+                    sums = f'{digest}  {Path(urlsplit(url).path).name}\n'
+                self.serve_text(urlsplit(checksum['url'].format(version=latest)).path, sums)
+
+            rewritten[name] = tool
+        return rewritten
+
+    @property
+    def size(self):
+        return sum(len(data) for data in self.files.values())
+
+    def graphql(self, query):
+        # The part of GitHub's GraphQL API github.request_batch() uses
+        data = {}
+        errors = []
+        for alias, owner, name in REPOSITORY_QUERY.findall(query):
+            repo = f'{json.loads(owner)}/{json.loads(name)}'
+            releases = self.repositories.get(repo) if repo != self.hidden else None
+            if releases is None:
+                data[alias] = None
+                errors.append({
+                    'type': 'NOT_FOUND',
+                    'path': [alias],
+                    'message': f"Could not resolve to a Repository with the name '{repo}'.",
+                })
+                continue
+            data[alias] = {'releases': {'nodes': [
+                {
+                    'name': release['name'],
+                    'tagName': release['tag_name'],
+                    'isDraft': release['draft'],
+                    'isPrerelease': release['prerelease'],
+                }
+                for release in releases
+            ]}}
+        result = {'data': data}
+        if errors:
+            result['errors'] = errors
+        return result
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive, ranges and ETags, the parts of a CDN the downloader uses
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        self.server.count(path)
+        length = int(self.headers.get('Content-Length', 0))
+        request = self.rfile.read(length)
+        if path != GRAPHQL_PATH:
+            self.send_error(404)
+            return
+        if not self.headers.get('Authorization'):
+            self.send_error(401, 'This endpoint requires you to be authenticated.')
+            return
+
+        try:
+            query = json.loads(request)['query']
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400)
+            return
+        data = json.dumps(self.server.release.graphql(query)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def respond(self, body):
+        release = self.server.release
+        path = urlsplit(self.path).path
+        self.server.count(path)
+        if path in release.redirects:
+            self.send_response(302)
+            self.send_header('Location', f'{release.base}{release.redirects[path]}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data = release.files.get(path)
+        if data is None:
+            self.send_error(404)
+            return
+
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end, status = 0, len(data) - 1, 200
+        ranges = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if ranges and (if_range is None or if_range == etag):
+            start = int(ranges[1])
+            end = min(int(ranges[2]), end) if ranges[2] else end
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', release.types.get(path, 'application/octet-stream'))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+        if body:
+            try:
+                self.wfile.write(memoryview(data)[start:end + 1])
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, release, address=('127.0.0.1', 0)):
+        super().__init__(address, Handler)
+        self.release = release
+        # Requests by path, so a benchmark can tell which lookups went out
+        self.hits = Counter()
+        self.lock = threading.Lock()
+        host, port = self.server_address[:2]
+        self.base = f'http://{host}:{port}'
+        self.manifest = release.build(self.base)
+
+    def count(self, path):
+        with self.lock:
+            self.hits[path] += 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def manifest_text(manifest):
+    # tomllib can't write, every value in a manifest is a string, a number,
+    # a boolean or a table of those
+    def value(item):
+        if isinstance(item, bool):
+            return 'true' if item else 'false'
+        if isinstance(item, dict):
+            return '{ ' + ', '.join(f'{key} = {value(field)}' for key, field in item.items()) + ' }'
+        if isinstance(item, str):
+            return json.dumps(item)
+        return str(item)
+
+    return ''.join(
+        f'[{name}]\n' + ''.join(f'{key} = {value(field)}\n' for key, field in tool.items()) + '\n'
+        for name, tool in manifest.items()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic releases of every tool in the manifest')
+    parser.add_argument('tools', nargs='*')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--scale', type=float, default=0.1, help='archive size relative to the real ones')
+    parser.add_argument('--manifest', type=Path, default=Path('fake-tools.toml'), help='where to write the rewritten manifest')
+    args = parser.parse_args()
+
+    with open(engine.MANIFEST_PATH, 'rb') as file:
+        manifest = tomllib.load(file)
+    server = Server(Release(manifest, args.scale, args.tools or None), ('127.0.0.1', args.port))
+    args.manifest.write_text(manifest_text(server.manifest))
+    print(f'Serving {server.release.size / MIB:.0f} MiB on {server.base}')
+    print(f'SOFTWARE_MANIFEST={args.manifest.resolve()} SOFTWARE_GITHUB_API_URL={server.base}/github')
+    print('GraphQL batches need a token, any will do: GITHUB_TOKEN=fake')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import contextlib
+import ctypes
+import errno
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+# linux/fcntl.h, linux/fs.h
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+_libc = ctypes.CDLL(None, use_errno=True)
+
+# Everything the updaters install, download or cache lives under here
+SOFTWARE_ROOT = Path(os.environ.get('SOFTWARE_ROOT', '~/Software')).expanduser()
+
+
+def write_text(path, text):
+    # Readers either see the previous file or the new one, never half of it
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def write_json(path, data):
+    write_text(path, json.dumps(data))
+
+
+def link_version(symlink, prefix, suffix=''):
+    # The version in the name of whatever symlink points at, e.g.
+    # ~/Software/go -> go-1.21.3 gives 1.21.3 for prefix 'go-'
+    try:
+        name = Path(os.readlink(symlink)).name
+    except OSError:
+        return None
+
+    if not name.startswith(prefix) or not name.endswith(suffix):
+        return None
+    return name[len(prefix):len(name) - len(suffix)]
+
+
+def replace_symlink(path, target):
+    # Point path at target without a moment where path is missing: the new
+    # link is made under a temporary name and renamed over the old one
+    with contextlib.suppress(OSError):
+        if os.readlink(path) == str(target):
+            return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+    tmp.unlink(missing_ok=True)
+    tmp.symlink_to(target)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def exchange(a, b):
+    # Swap two existing paths in one step (Linux 3.15+), False where the
+    # kernel, libc or filesystem can't
+    renameat2 = getattr(_libc, 'renameat2', None)
+    if renameat2 is None:
+        return False
+    if renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0:
+        return True
+
+    error = ctypes.get_errno()
+    if error in (errno.ENOSYS, errno.EINVAL):
+        return False
+    raise OSError(error, os.strerror(error), str(a))
+
+
+def replace_tree(source, path):
+    # Move the directory source to path, replacing whatever is there
+    if not (path.is_symlink() or path.exists()):
+        os.rename(source, path)
+        return
+
+    if exchange(source, path):
+        old = source
+    else:
+        old = path.with_name(f'.{path.name}.{os.getpid()}.old')
+        os.rename(path, old)
+        os.rename(source, path)
+
+    if old.is_dir() and not old.is_symlink():
+        shutil.rmtree(old)
+    else:
+        old.unlink()
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+
+import requests
+
+import download
+import index_cache
+
+API_URL = os.environ.get('SOFTWARE_GITHUB_API_URL', 'https://api.github.com')
+GRAPHQL_URL = os.environ.get('SOFTWARE_GITHUB_GRAPHQL_URL', f'{API_URL}/graphql')
+RELEASES_URL = f'{API_URL}/repos/{{slug}}/releases'
+# GitHub only answers GraphQL queries from authenticated clients
+TOKEN = os.environ.get('GITHUB_TOKEN')
+# Same page size as the REST releases endpoint
+RELEASE_COUNT = 30
+
+REPOSITORY_QUERY = '''
+  {alias}: repository(owner: {owner}, name: {name}) {{
+    releases(first: {count}, orderBy: {{field: CREATED_AT, direction: DESC}}) {{
+      nodes {{ name tagName isDraft isPrerelease }}
+    }}
+  }}'''
+
+# Slugs worth resolving together, e.g. every updater update_all is about to run
+_registered = set()
+# slug -> releases, in the shape of the REST endpoint
+_releases = {}
+_batch = None
+
+
+class GraphQLError(Exception):
+    pass
+
+
+def register(*slugs):
+    _registered.update(slugs)
+
+
+def batch_query(slugs):
+    repositories = ''.join(
+        REPOSITORY_QUERY.format(
+            alias=f'r{index}',
+            owner=json.dumps(slug.split('/', 1)[0]),
+            name=json.dumps(slug.split('/', 1)[1]),
+            count=RELEASE_COUNT,
+        )
+        for index, slug in enumerate(slugs)
+    )
+    return f'query {{{repositories}\n}}'
+
+
+def rest_shape(node):
+    # The fields latest_version() reads from the REST releases endpoint
+    return {
+        'name': node['name'],
+        'tag_name': node['tagName'],
+        'draft': node['isDraft'],
+        'prerelease': node['isPrerelease'],
+    }
+
+
+async def request_batch(slugs):
+    # One repository is as cheap over REST, which can also revalidate
+    if len(slugs) < 2:
+        return
+
+    response = await download.request(
+        GRAPHQL_URL,
+        method='POST',
+        json={'query': batch_query(slugs)},
+        headers={'Authorization': f'bearer {TOKEN}'},
+    )
+    result = response.json()
+    data = result.get('data')
+    if not data:
+        raise GraphQLError(result.get('errors'))
+
+    for index, slug in enumerate(slugs):
+        # Missing repositories come back as null alongside an error,
+        # those fall back to the REST endpoint
+        repository = data.get(f'r{index}')
+        if repository is not None:
+            _releases[slug] = [
+                rest_shape(node)
+                for node in repository['releases']['nodes']
+            ]
+            # A POST can't be revalidated, the next run within the TTL
+            # reads these instead of asking again
+            index_cache.save(RELEASES_URL.format(slug=slug), json.dumps(_releases[slug]))
+
+
+def stale_slugs():
+    # Registered repositories the index cache can't answer for yet
+    return sorted(
+        slug for slug in _registered
+        if not index_cache.is_fresh(RELEASES_URL.format(slug=slug))
+    )
+
+
+async def request_releases(slug):
+    global _batch
+
+    if slug in _releases:
+        return _releases[slug]
+
+    url = RELEASES_URL.format(slug=slug)
+    if TOKEN and slug in _registered and not index_cache.is_fresh(url):
+        if _batch is None:
+            _batch = asyncio.get_running_loop().create_task(
+                request_batch(stale_slugs())
+            )
+        try:
+            await asyncio.shield(_batch)
+        except (requests.RequestException, GraphQLError) as e:
+            print(f'{GRAPHQL_URL}: batch lookup failed ({e}), using the REST API')
+        if slug in _releases:
+            return _releases[slug]
+
+    return await index_cache.request_json(url)
+
+
+def releases(slug):
+    return download.run(request_releases(slug))
+
+
+def catalogue_entries(slug, version, fetch_url):
+    # version(entry) -> the version string the updater installs
+    return [
+        {
+            'version': version(entry),
+            'prerelease': entry['prerelease'],
+            'url': fetch_url.format(version=version(entry)),
+        }
+        for entry in releases(slug)
+        if not entry['draft']
+    ]
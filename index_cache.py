@@ -0,0 +1,146 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import time
+
+import requests
+
+import download
+import fsutil
+import metrics
+
+INDEX_DIR = download.CACHE_DIR / 'index'
+# Use the cached index without asking the server while it is this fresh
+TTL = float(os.environ.get('SOFTWARE_INDEX_TTL', 300))
+# Past the TTL, keep answering from the cache for this long while the
+# entry is revalidated in the background
+STALE_WHILE_REVALIDATE = float(os.environ.get('SOFTWARE_INDEX_SWR', 3600))
+# How long to wait at exit for background revalidations to land
+FLUSH_SECONDS = 5
+
+# url -> task, so concurrent lookups of one index share a request
+_inflight = {}
+
+
+def entry_path(url):
+    return INDEX_DIR / f'{hashlib.sha256(url.encode()).hexdigest()}.json'
+
+
+def load(url):
+    try:
+        return json.loads(entry_path(url).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(url, ttl=None):
+    ttl = TTL if ttl is None else ttl
+    entry = load(url)
+    return entry is not None and time.time() - entry['fetched_at'] < ttl
+
+
+def save(url, body):
+    # An index fetched some other way, e.g. in a batch, answers for url
+    # until the TTL runs out
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    fsutil.write_json(entry_path(url), {
+        'url': url,
+        'etag': None,
+        'last_modified': None,
+        'fetched_at': time.time(),
+        'body': body,
+    })
+
+
+async def _revalidate(url, entry):
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = await download.request(url, headers=headers)
+    if response.status_code == 304 and entry is not None:
+        metrics.cache('revalidated')
+        entry['fetched_at'] = time.time()
+    else:
+        metrics.cache('miss')
+        entry = {
+            'url': url,
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'fetched_at': time.time(),
+            'body': response.text,
+        }
+
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    fsutil.write_json(entry_path(url), entry)
+    return entry
+
+
+def revalidate(url, entry):
+    task = _inflight.get(url)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(_revalidate(url, entry))
+        _inflight[url] = task
+        task.add_done_callback(lambda task: _done(url, task))
+    return task
+
+
+def _done(url, task):
+    _inflight.pop(url, None)
+    # Background revalidation failures are retried on the next lookup
+    if not task.cancelled():
+        task.exception()
+
+
+async def request_text(url, ttl=None):
+    ttl = TTL if ttl is None else ttl
+    entry = load(url)
+    age = time.time() - entry['fetched_at'] if entry else None
+
+    if entry is not None and age < ttl:
+        metrics.cache('fresh')
+        return entry['body']
+
+    if entry is not None and age < ttl + STALE_WHILE_REVALIDATE:
+        metrics.cache('stale')
+        revalidate(url, entry)
+        return entry['body']
+
+    try:
+        entry = await revalidate(url, entry)
+    except requests.RequestException:
+        # Offline or rate limited: an old index beats no index
+        if entry is None:
+            raise
+        metrics.cache('offline')
+        print(f'{url}: using cached index from {time.ctime(entry["fetched_at"])}')
+    return entry['body']
+
+
+async def request_json(url, ttl=None):
+    return json.loads(await request_text(url, ttl))
+
+
+async def _flush(timeout):
+    pending = list(_inflight.values())
+    if pending:
+        await asyncio.wait(pending, timeout=timeout)
+
+
+@atexit.register
+def flush():
+    if _inflight:
+        download.run(_flush(FLUSH_SECONDS))
+
+
+def get_text(url, ttl=None):
+    return download.run(request_text(url, ttl))
+
+
+def get_json(url, ttl=None):
+    return download.run(request_json(url, ttl))
@@ -0,0 +1,185 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import resource
+import threading
+import time
+from pathlib import Path
+
+import fsutil
+
+# One JSON object per tool per run, appended
+LOG_PATH = Path(os.environ.get('SOFTWARE_METRICS_LOG', fsutil.SOFTWARE_ROOT / '.cache' / 'metrics.jsonl'))
+# Latest run of every tool in the Prometheus text format, point this into
+# node-exporter's --collector.textfile.directory to scrape it
+TEXTFILE_PATH = Path(os.environ.get('SOFTWARE_METRICS_TEXTFILE', fsutil.SOFTWARE_ROOT / '.cache' / 'software.prom'))
+# The runs the textfile is rendered from, so one tool's run keeps the others
+LATEST_PATH = fsutil.SOFTWARE_ROOT / '.cache' / 'metrics-latest.json'
+ENABLED = os.environ.get('SOFTWARE_METRICS', '1') != '0'
+
+# The run being measured. Stages hop between threads and the download
+# loop, each carries a copy of the context it was started from.
+_current = contextvars.ContextVar('metrics_run', default=None)
+_write_lock = threading.Lock()
+
+
+class Run:
+    def __init__(self, tool):
+        self.tool = tool
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.http = {}
+        self.cache = {}
+
+    def add(self, table, key, value):
+        with self.lock:
+            table[key] = table.get(key, 0) + value
+
+    def record(self, ok):
+        downloaded = self.counters.get('bytes_downloaded', 0)
+        download_seconds = self.counters.get('download_seconds', 0)
+        return {
+            'tool': self.tool,
+            'started': self.started,
+            'seconds': time.time() - self.started,
+            'ok': ok,
+            'phases': self.phases,
+            'bytes_downloaded': downloaded,
+            'throughput_bytes_per_second': downloaded / download_seconds if download_seconds else None,
+            'files_written': self.counters.get('files_written', 0),
+            'bytes_written': self.counters.get('bytes_written', 0),
+            'bytes_hashed': self.counters.get('bytes_hashed', 0),
+            'http': self.http,
+            'cache': self.cache,
+            # Kilobytes on Linux, and for the whole process: tools that run
+            # together share one peak
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+
+
+def start(tool):
+    # Starts measuring tool in the current context
+    run = Run(tool)
+    _current.set(run)
+    return run
+
+
+def finish(run, ok):
+    if not ENABLED:
+        return
+    record = run.record(ok)
+    with _write_lock:
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with LOG_PATH.open('a') as log:
+            log.write(json.dumps(record) + '\n')
+
+        try:
+            latest = json.loads(LATEST_PATH.read_text())
+        except (OSError, ValueError):
+            latest = {}
+        latest[run.tool] = record
+        fsutil.write_json(LATEST_PATH, latest)
+        fsutil.write_text(TEXTFILE_PATH, textfile(latest))
+
+
+@contextlib.contextmanager
+def measure(tool):
+    run = start(tool)
+    try:
+        yield run
+    except BaseException:
+        finish(run, False)
+        raise
+    finish(run, True)
+
+
+def count(name, value=1):
+    run = _current.get()
+    if run is not None:
+        run.add(run.counters, name, value)
+
+
+def http(status):
+    run = _current.get()
+    if run is not None:
+        run.add(run.http, str(status), 1)
+
+
+def cache(result):
+    # 'fresh', 'stale', 'revalidated', 'miss' or 'offline'
+    run = _current.get()
+    if run is not None:
+        run.add(run.cache, result, 1)
+
+
+@contextlib.contextmanager
+def phase(name):
+    began = time.monotonic()
+    try:
+        yield
+    finally:
+        run = _current.get()
+        if run is not None:
+            run.add(run.phases, name, time.monotonic() - began)
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def label(value):
+    return json.dumps(str(value))
+
+
+def textfile(latest):
+    # Prometheus text exposition format, one family at a time
+    families = {
+        'software_update_success': ('gauge', 'Whether the last update run succeeded'),
+        'software_update_last_run_timestamp_seconds': ('gauge', 'When the last update run started'),
+        'software_update_duration_seconds': ('gauge', 'Wall time of the last update run'),
+        'software_update_phase_seconds': ('gauge', 'Time the last update run spent per phase'),
+        'software_update_downloaded_bytes': ('gauge', 'Bytes downloaded by the last update run'),
+        'software_update_download_throughput_bytes_per_second': ('gauge', 'Effective download throughput'),
+        'software_update_files_written': ('gauge', 'Files written by the last update run'),
+        'software_update_written_bytes': ('gauge', 'Bytes written by the last update run'),
+        'software_update_http_responses': ('gauge', 'HTTP responses by status in the last update run'),
+        'software_update_index_cache_lookups': ('gauge', 'Index cache lookups by result in the last update run'),
+        'software_update_peak_rss_bytes': ('gauge', 'Peak resident set size of the updating process'),
+    }
+    samples = {name: [] for name in families}
+    for tool, record in sorted(latest.items()):
+        tool_label = f'tool={label(tool)}'
+        samples['software_update_success'].append((tool_label, int(record['ok'])))
+        samples['software_update_last_run_timestamp_seconds'].append((tool_label, record['started']))
+        samples['software_update_duration_seconds'].append((tool_label, record['seconds']))
+        for name, seconds in sorted(record['phases'].items()):
+            samples['software_update_phase_seconds'].append((f'{tool_label},phase={label(name)}', seconds))
+        samples['software_update_downloaded_bytes'].append((tool_label, record['bytes_downloaded']))
+        if record['throughput_bytes_per_second'] is not None:
+            samples['software_update_download_throughput_bytes_per_second'].append(
+                (tool_label, record['throughput_bytes_per_second'])
+            )
+        samples['software_update_files_written'].append((tool_label, record['files_written']))
+        samples['software_update_written_bytes'].append((tool_label, record['bytes_written']))
+        for status, responses in sorted(record['http'].items()):
+            samples['software_update_http_responses'].append((f'{tool_label},status={label(status)}', responses))
+        for result, lookups in sorted(record['cache'].items()):
+            samples['software_update_index_cache_lookups'].append((f'{tool_label},result={label(result)}', lookups))
+        samples['software_update_peak_rss_bytes'].append((tool_label, record['peak_rss_bytes']))
+
+    lines = []
+    for name, (kind, help_text) in families.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{name}{{{labels}}} {value}' for labels, value in samples[name])
+    return '\n'.join(lines) + '\n'
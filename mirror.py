@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+import argparse
+import hashlib
+import http.server
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+import download
+import engine
+
+# Artifacts the mirror has fetched, laid out like the URLs it serves
+MIRROR_DIR = download.CACHE_DIR / 'mirror'
+PORT = 8780
+
+_lock = threading.Lock()
+# cache path -> lock, so concurrent misses fetch from upstream once
+_fetching = {}
+
+
+def allowed_hosts(extra=()):
+    # Hosts the manifest downloads from, anything else is refused so the
+    # mirror isn't an open proxy. Artifacts an index redirects to (vscode)
+    # live elsewhere and have to be allowed by hand.
+    hosts = set(extra)
+    for spec in engine.manifest().values():
+        if 'url' in spec:
+            hosts.add(urlsplit(spec['url']).netloc)
+    return hosts
+
+
+def locate(path):
+    # /https/go.dev/dl/go1.22.1.linux-amd64.tar.gz ->
+    # (https://go.dev/dl/go1.22.1.linux-amd64.tar.gz, host, cache path)
+    parts = urlsplit(path)
+    scheme, _, rest = parts.path.lstrip('/').partition('/')
+    host, _, rest = rest.partition('/')
+    # Split by hand: PurePosixPath would turn '//etc/passwd' into an
+    # absolute path and joinpath() would then leave MIRROR_DIR
+    segments = rest.split('/')
+    if scheme not in ('http', 'https') or host in ('', '.', '..') or '/' in host or any(
+        segment in ('', '.', '..') for segment in segments
+    ):
+        raise LookupError(path)
+
+    upstream = f'{scheme}://{host}/{rest}'
+    cache = MIRROR_DIR.joinpath(scheme, host, *segments)
+    if parts.query:
+        upstream = f'{upstream}?{parts.query}'
+        cache = cache.with_name(f'{cache.name}@{hashlib.sha256(parts.query.encode()).hexdigest()[:16]}')
+    if not cache.resolve().is_relative_to(MIRROR_DIR.resolve()):
+        raise LookupError(path)
+    return upstream, host, cache
+
+
+def fetch(upstream, cache):
+    # Release artifacts don't change once published, a cached one is
+    # served as it is
+    if cache.exists():
+        return
+
+    with _lock:
+        lock = _fetching.setdefault(cache, threading.Lock())
+    with lock:
+        if cache.exists():
+            return
+        print(f'miss: {upstream}')
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        download.save(upstream, cache)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def respond(self, body):
+        try:
+            upstream, host, cache = locate(self.path)
+        except LookupError:
+            self.send_error(404)
+            return
+        if host not in self.server.hosts:
+            self.send_error(403, f'{host} is not mirrored')
+            return
+
+        # A HEAD on a miss waits for the whole artifact too, the client's
+        # GET that follows is then served from the cache
+        try:
+            fetch(upstream, cache)
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            self.send_error(status if status in (403, 404, 410) else 502, str(e))
+            return
+        except (requests.RequestException, OSError) as e:
+            self.send_error(502, str(e))
+            return
+
+        self.send_file(cache, body)
+
+    def send_file(self, path, body):
+        with path.open('rb') as file:
+            info = os.fstat(file.fileno())
+            size = info.st_size
+            etag = f'"{size:x}-{info.st_mtime_ns:x}"'
+
+            start, end, status = 0, size - 1, 200
+            ranges = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if_range = self.headers.get('If-Range')
+            if ranges and (if_range is None or if_range == etag):
+                start = int(ranges[1])
+                end = min(int(ranges[2]), end) if ranges[2] else end
+                if start > end:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            if body and end >= start:
+                try:
+                    self.connection.sendfile(file, start, end - start + 1)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, hosts):
+        super().__init__(address, Handler)
+        self.hosts = hosts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve the artifacts the updaters download, fetching each from upstream once. '
+                    'Point the updaters at it with SOFTWARE_MIRROR=http://<host>:<port>.',
+    )
+    # Only this host by default, serving a fleet means binding 0.0.0.0 or
+    # an internal address on purpose
+    parser.add_argument('--bind', default='127.0.0.1', help='address to listen on, e.g. 0.0.0.0 to serve other hosts')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--allow', action='append', default=[], metavar='HOST', help='also mirror artifacts from HOST')
+    args = parser.parse_args()
+
+    # The mirror itself always goes upstream, a SOFTWARE_MIRROR copied
+    # along with the rest of a host's environment would point it at itself
+    download.MIRROR = ''
+    server = Server((args.bind, args.port), allowed_hosts(args.allow))
+    print(f'Mirroring {", ".join(sorted(server.hosts))} from {MIRROR_DIR} on {args.bind}:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+
+IO_WORKERS = 8
+CPU_WORKERS = os.cpu_count() or 2
+
+# (stage, executor) in the order a release flows through them.
+# Network bound stages share the io pool, decompression and hashing
+# run on the cpu pool so one tool's extraction overlaps another's download.
+# An extract whose archive fetch left on the server streams it in, which
+# waits on the network like a fetch, so it goes to the io pool instead.
+STAGES = (
+    ('resolve', 'io'),
+    ('fetch', 'io'),
+    ('verify', 'cpu'),
+    ('extract', 'cpu'),
+    ('link', 'io'),
+)
+
+
+class Release:
+    def __init__(self, name, updater):
+        self.name = name
+        self.updater = updater
+        self.version = None
+        self.artifact = None
+        self.installed = None
+        # Every stage runs in this context, so the release's metrics follow
+        # it from pool to pool
+        self.context = contextvars.copy_context()
+        self.metrics = self.context.run(metrics.start, name)
+
+    def __repr__(self):
+        return f'<Release {self.name} {self.version}>'
+
+
+class Stage:
+    def __init__(self, name, executor, executors):
+        self.name = name
+        self.executor = executor
+        self.executors = executors
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.timings = {}
+
+    def submit(self, release):
+        with self.lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        return self.executors[self.executor_for(release)].submit(release.context.run, self.run, release)
+
+    def executor_for(self, release):
+        if self.name == 'extract' and release.artifact is not None and not os.path.exists(release.artifact):
+            return 'io'
+        return self.executor
+
+    def run(self, release):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+
+        start = time.monotonic()
+        try:
+            call_stage(self.name, release)
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.running -= 1
+                self.timings[release.name] = elapsed
+
+
+def call_stage(name, release):
+    func = getattr(release.updater, name)
+
+    if name == 'resolve':
+        release.version = func()
+    elif name == 'fetch':
+        release.artifact = func(release.version)
+    elif name == 'verify':
+        func(release.version, release.artifact)
+    elif name == 'extract':
+        release.installed = func(release.version, release.artifact)
+    elif name == 'link':
+        func(release.version, release.installed or release.artifact)
+    else:
+        raise ValueError(f'Unknown stage: {name}')
+
+
+class Pipeline:
+    def __init__(self, io_workers=IO_WORKERS, cpu_workers=CPU_WORKERS):
+        self.executors = {
+            'io': ThreadPoolExecutor(io_workers, thread_name_prefix='io'),
+            'cpu': ThreadPoolExecutor(cpu_workers, thread_name_prefix='cpu'),
+        }
+        self.stages = [
+            Stage(name, executor, self.executors)
+            for name, executor in STAGES
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+
+    def submit(self, name, updater) -> Future:
+        done = Future()
+        self.advance(Release(name, updater), 0, done)
+        return done
+
+    def advance(self, release, index, done):
+        # Every stage runs, an updater missing one fails with AttributeError
+        if index == len(self.stages):
+            metrics.finish(release.metrics, True)
+            done.set_result(release)
+            return
+
+        def on_done(future):
+            error = future.exception()
+            if error is not None:
+                metrics.finish(release.metrics, False)
+                done.set_exception(error)
+            else:
+                self.advance(release, index + 1, done)
+
+        self.stages[index].submit(release).add_done_callback(on_done)
+
+    def depths(self):
+        return {
+            stage.name: (stage.queued, stage.running)
+            for stage in self.stages
+        }
+
+    def report(self):
+        print(f'{"stage":<10} {"jobs":>5} {"max queue":>10} {"total s":>9} {"slowest":>20}')
+        for stage in self.stages:
+            with stage.lock:
+                timings = dict(stage.timings)
+            total = sum(timings.values())
+            slowest = max(timings, key=timings.get, default='')
+            if slowest:
+                slowest = f'{slowest} {timings[slowest]:.1f}s'
+            print(f'{stage.name:<10} {len(timings):>5} {stage.max_queued:>10} {total:>9.1f} {slowest:>20}')
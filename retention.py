@@ -0,0 +1,372 @@
+import os
+import re
+import shutil
+import stat
+import time
+from pathlib import Path
+
+import checksums
+import fsutil
+import semver
+import store
+import unpack
+
+# How many of the newest installed versions and downloaded archives each
+# tool keeps, keep_versions and keep_archives in tools.toml override them.
+# Whatever a symlink points at is kept regardless.
+KEEP_VERSIONS = int(os.environ.get('SOFTWARE_KEEP_VERSIONS', 2))
+KEEP_ARCHIVES = int(os.environ.get('SOFTWARE_KEEP_ARCHIVES', 1))
+# What all of SOFTWARE_ROOT may take (e.g. 20G), past it the least
+# recently used versions go too
+BUDGET = os.environ.get('SOFTWARE_GC_BUDGET')
+# Anything touched more recently may belong to an update that is running
+GRACE_SECONDS = 3600
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(text):
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?', text.strip(), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'{text!r} is not a size')
+    return int(float(match[1]) * UNITS[match[2].upper()])
+
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TiB'
+
+
+def version_key(version):
+    # Semantic versions by precedence, anything else (build numbers, four
+    # part versions) by its numbers
+    try:
+        return (1, semver.parse(version).key)
+    except ValueError:
+        return (0, tuple(int(number) for number in re.findall(r'\d+', version)))
+
+
+# What the updaters keep beside an artifact or tree, never a version
+# of its own (staging directories, journals and temp files are hidden)
+SIDECAR_SUFFIXES = ('.verified', '.part', '.part.json')
+
+
+def template_regex(template):
+    # 'go-{version}' -> a regex for paths relative to SOFTWARE_ROOT, with
+    # the version as a group that doesn't span directories
+    parts = template.split('{version}')
+    return re.compile(re.escape(parts[0]) + ''.join(
+        ('(?P<version>[^/]+)' if index == 0 else '(?P=version)') + re.escape(part)
+        for index, part in enumerate(parts[1:])
+    ))
+
+
+def specificity(template):
+    return len(template.replace('{version}', ''))
+
+
+def find(template, others=()):
+    # version -> path for everything under SOFTWARE_ROOT the template
+    # names. A path that one of the others names more specifically is
+    # theirs: teleport-{version} also matches the archive
+    # teleport-{version}-linux-amd64-bin.tar.gz.
+    if '{version}' not in template:
+        return {}
+
+    regex = template_regex(template)
+    specific = [
+        template_regex(other) for other in others
+        if '{version}' in other and specificity(other) > specificity(template)
+    ]
+    found = {}
+    for path in fsutil.SOFTWARE_ROOT.glob(template.replace('{version}', '*')):
+        if path.name.startswith('.') or path.name.endswith(SIDECAR_SUFFIXES):
+            continue
+        relative = path.relative_to(fsutil.SOFTWARE_ROOT).as_posix()
+        match = regex.fullmatch(relative)
+        if match is None or any(other.fullmatch(relative) for other in specific):
+            continue
+        found[match['version']] = path
+    return found
+
+
+def last_used(path):
+    # Running a binary moves its atime (relatime: at most daily). Anything
+    # that lists a directory moves the directory's, so a tree goes by the
+    # executables in it and in its bin/.
+    try:
+        info = path.stat()
+    except OSError:
+        return 0
+    if not stat.S_ISDIR(info.st_mode):
+        return max(info.st_atime, info.st_mtime)
+
+    used = info.st_mtime
+    for directory in (path, path / 'bin'):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                used = max(used, entry.stat(follow_symlinks=False).st_atime)
+    return used
+
+
+def changed(path):
+    try:
+        return path.lstat().st_mtime
+    except OSError:
+        return 0
+
+
+def files(path):
+    # lstat of every file under path, without following links
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISDIR(info.st_mode):
+        yield info
+        return
+
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                yield os.lstat(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def delete(path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class Item:
+    # One version's install or archive, with every path that goes with it
+    def __init__(self, tool, version, kind, paths):
+        self.tool = tool
+        self.version = version
+        self.kind = kind
+        self.paths = [path for path in paths if path.exists() or path.is_symlink()]
+        self.last_used = max((last_used(path) for path in self.paths), default=0)
+        # Not the atime: version trees share files through the store, so
+        # extracting a new version reads as a use of the old ones
+        self.changed = max((changed(path) for path in self.paths), default=0)
+
+    def __repr__(self):
+        return f'<Item {self.tool.name} {self.version} {self.kind}>'
+
+
+def install_paths(tool, version):
+    if tool.layout == 'tree':
+        root = tool.path('root', version)
+        return [root, *unpack.staging_paths(root)]
+
+    if tool.layout == 'member':
+        if 'link_target' in tool.spec:
+            # A directory of its own, e.g. helm-v3.14.0/bin/helm
+            return [tool.path('link_target', version)]
+        target = tool.path('target', version)
+        return [target, target.with_name(f'.{target.name}.staging')]
+
+    if tool.layout == 'binary':
+        artifact = tool.path('file', version)
+        return [artifact, checksums.sidecar_path(artifact)]
+
+    # dpkg owns whatever a deb installed
+    return []
+
+
+def archive_paths(tool, version):
+    if tool.layout == 'binary':
+        # The download is the install
+        return []
+
+    artifact = tool.path('file', version)
+    return [
+        artifact,
+        checksums.sidecar_path(artifact),
+        artifact.with_name(f'{artifact.name}.part'),
+        artifact.with_name(f'{artifact.name}.part.json'),
+    ]
+
+
+def items(tool):
+    # (installs, archives), newest version first
+    key = {'tree': 'root', 'member': 'target', 'binary': 'file'}.get(tool.layout)
+    templates = [tool.spec[name] for name in ('root', 'target', 'link_target', 'file') if name in tool.spec]
+    installs = find(tool.spec[key], templates) if key else {}
+    archives = find(tool.spec['file'], templates) if tool.layout != 'binary' else {}
+    return (
+        [Item(tool, version, 'install', install_paths(tool, version))
+         for version in sorted(installs, key=version_key, reverse=True)],
+        [Item(tool, version, 'archive', archive_paths(tool, version))
+         for version in sorted(archives, key=version_key, reverse=True)],
+    )
+
+
+def live_targets(tools):
+    # What the symlinks in SOFTWARE_ROOT and next to each tool's own link
+    # resolve to, links the user made there included
+    directories = {fsutil.SOFTWARE_ROOT}
+    for tool in tools:
+        if 'link' in tool.spec:
+            directories.add(tool.path('link').parent)
+
+    live = set()
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_symlink():
+                live.add(Path(os.path.realpath(entry.path)))
+    return live
+
+
+def is_live(item, live):
+    for path in item.paths:
+        path = Path(os.path.realpath(path))
+        for target in live:
+            if target == path or target.is_relative_to(path) or path.is_relative_to(target):
+                return True
+    return False
+
+
+class Usage:
+    # Disk blocks by inode, so a file shared with the store through hard
+    # links only counts as reclaimed once no version tree links it anymore
+    def __init__(self):
+        self.links = {}
+        # inode -> store object, the objects removals leave unreferenced
+        self.objects = {}
+        self.orphaned = []
+        for directory, _, names in os.walk(store.OBJECTS_DIR):
+            for name in names:
+                path = Path(directory, name)
+                try:
+                    info = path.lstat()
+                except FileNotFoundError:
+                    continue
+                self.objects[(info.st_dev, info.st_ino)] = path
+
+    def remove(self, item):
+        freed = 0
+        for path in item.paths:
+            for info in files(path):
+                inode = (info.st_dev, info.st_ino)
+                links = self.links.get(inode, info.st_nlink) - 1
+                self.links[inode] = links
+                if inode in self.objects:
+                    if links == 1:
+                        freed += info.st_blocks * 512
+                        self.orphaned.append(self.objects[inode])
+                elif links == 0:
+                    freed += info.st_blocks * 512
+        return freed
+
+
+def disk_usage(path):
+    seen = set()
+    total = 0
+    for info in files(path):
+        inode = (info.st_dev, info.st_ino)
+        if inode not in seen:
+            seen.add(inode)
+            total += info.st_blocks * 512
+    return total
+
+
+def plan(tools, budget=None, now=None):
+    # [(item, bytes it frees)] to remove, in order
+    now = time.time() if now is None else now
+    live = live_targets(tools)
+    usage = Usage()
+    removals = []
+    candidates = []
+
+    def protected(item):
+        return is_live(item, live) or now - item.changed < GRACE_SECONDS
+
+    for tool in tools:
+        installs, archives = items(tool)
+        for found, keep in (
+            (installs, tool.spec.get('keep_versions', KEEP_VERSIONS)),
+            (archives, tool.spec.get('keep_archives', KEEP_ARCHIVES)),
+        ):
+            for index, item in enumerate(found):
+                if protected(item):
+                    continue
+                if index < keep:
+                    candidates.append(item)
+                else:
+                    removals.append((item, usage.remove(item)))
+
+    if budget is not None:
+        used = disk_usage(fsutil.SOFTWARE_ROOT) - sum(freed for _, freed in removals)
+        for item in sorted(candidates, key=lambda item: item.last_used):
+            if used <= budget:
+                break
+            freed = usage.remove(item)
+            removals.append((item, freed))
+            used -= freed
+
+    return removals, usage
+
+
+def prune_store(now, orphaned):
+    # Removes the objects no tree links anymore: those this run orphaned,
+    # and older ones whose last link went long enough ago that no
+    # extraction is about to link them again. Returns the count and bytes
+    # of the older ones, the others are already accounted for.
+    for path in orphaned:
+        path.unlink(missing_ok=True)
+
+    count = 0
+    freed = 0
+    for directory, _, names in os.walk(store.OBJECTS_DIR):
+        for name in names:
+            if name.startswith('.tmp-'):
+                continue
+            path = Path(directory, name)
+            try:
+                info = path.lstat()
+            except FileNotFoundError:
+                continue
+            if info.st_nlink == 1 and now - info.st_ctime >= GRACE_SECONDS:
+                path.unlink(missing_ok=True)
+                count += 1
+                freed += info.st_blocks * 512
+    return count, freed
+
+
+def collect(tools, budget=None, dry_run=False):
+    # Removes what the retention policy and budget don't keep, returns
+    # the bytes reclaimed
+    now = time.time()
+    removals, usage = plan(tools, budget, now)
+
+    reclaimed = 0
+    for item, freed in removals:
+        print(f'{"would remove" if dry_run else "removing"} {item.tool.name} {item.version} {item.kind} ({format_size(freed)})')
+        if not dry_run:
+            for path in item.paths:
+                delete(path)
+        reclaimed += freed
+
+    if not dry_run:
+        count, freed = prune_store(now, usage.orphaned)
+        if count:
+            print(f'removing {count} unreferenced store objects ({format_size(freed)})')
+        reclaimed += freed
+
+    print(f'{"would reclaim" if dry_run else "reclaimed"} {format_size(reclaimed)}')
+    return reclaimed
@@ -1,39 +1,133 @@
+import functools
+import re
+
+# https://semver.org, plus the leading 'v' most tags carry
+PATTERN = re.compile(
+    r'v?(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)'
+    r'(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?'
+    r'(?:\+([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?'
+)
+
+# Sorts after every pre-release key, a release outranks its pre-releases
+RELEASE = (1, ())
+
+
+def prerelease_key(prerelease):
+    if prerelease is None:
+        return RELEASE
+
+    # Numeric identifiers compare numerically and before alphanumeric ones,
+    # a shorter run of equal identifiers comes first
+    return (0, tuple(
+        (0, int(identifier), '') if identifier.isdigit() else (1, 0, identifier)
+        for identifier in prerelease.split('.')
+    ))
+
+
 class SemVer():
+    __slots__ = ('major', 'minor', 'patch', 'prerelease', 'build', 'key')
+
     def __init__(self, version):
-        major, minor, patch = version.split('.', 3)
+        match = PATTERN.fullmatch(version.strip())
+        if match is None:
+            raise ValueError(f'{version!r} is not a semantic version')
 
-        self._hash = hash(version)
-        self._major = int(major.removeprefix('v'))
-        self._minor = int(minor)
-        try:
-            self._patch = int(patch)
-        except ValueError as e:
-            patch, extra = patch.split('-', 1)
-            self._patch = int(patch)
+        major, minor, patch, prerelease, build = match.groups()
+        major, minor, patch = int(major), int(minor), int(patch)
+        # Build metadata doesn't take part in precedence
+        key = (major, minor, patch, prerelease_key(prerelease))
+        # Read-only from here on, parse() shares instances
+        for name, value in zip(self.__slots__, (major, minor, patch, prerelease, build, key)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __reduce__(self):
+        # Copies and pickles are built through __init__ too
+        build = f'+{self.build}' if self.build is not None else ''
+        return type(self), (f'{self.version}{build}',)
 
     def __hash__(self):
-        return self._hash
+        return hash(self.key)
 
     def __repr__(self):
         return f'<SemVer {self.version}>'
 
     @property
     def version(self):
-        return f'{self._major}.{self._minor}.{self._patch}'
+        version = f'{self.major}.{self.minor}.{self.patch}'
+        if self.prerelease is not None:
+            version = f'{version}-{self.prerelease}'
+        return version
 
     def __eq__(self, other):
-        return (
-            self._major == other._major
-            and self._minor == other._minor
-            and self._patch == other._patch
-        )
+        if not isinstance(other, SemVer):
+            return NotImplemented
+        return self.key == other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, SemVer):
+            return NotImplemented
+        return self.key < other.key
+
+    def __le__(self, other):
+        if not isinstance(other, SemVer):
+            return NotImplemented
+        return self.key <= other.key
 
     def __gt__(self, other):
-        if self.__eq__(other):
-            return False
-
-        return (
-            self._major > other._major
-            or (self._major >= other._major and self._minor > other._minor)
-            or (self._major >= other._major and self._minor >= other._minor and self._patch > other._patch)
-        )
+        if not isinstance(other, SemVer):
+            return NotImplemented
+        return self.key > other.key
+
+    def __ge__(self, other):
+        if not isinstance(other, SemVer):
+            return NotImplemented
+        return self.key >= other.key
+
+
+def sort_text(version):
+    # The precedence key as a string that orders the same way, for
+    # storage that can only sort plain columns (e.g. an SQLite index).
+    # ' ' sorts below every identifier character and '~' above them.
+    major, minor, patch, (_, identifiers) = version.key
+    text = f'{major:010d}.{minor:010d}.{patch:010d}'
+    if version.prerelease is None:
+        return f'{text}~'
+    return f'{text}-' + ' '.join(
+        f'0{number:020d}' if kind == 0 else f'1{identifier}'
+        for kind, number, identifier in identifiers
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def parse(version):
+    # The same tags come back on every run and from every index,
+    # instances are read-only so they can be shared
+    return SemVer(version)
+
+
+def max_version(entries, key=lambda entry: entry, where=None, prerelease=True):
+    # (SemVer, entry) for the highest version among the entries where()
+    # accepts, entries that aren't semantic versions are skipped
+    latest = None
+    latest_key = None
+    for entry in entries:
+        if where is not None and not where(entry):
+            continue
+
+        try:
+            version = parse(key(entry))
+        except ValueError:
+            continue
+        if not prerelease and version.prerelease is not None:
+            continue
+
+        if latest is None or version.key > latest_key:
+            latest = (version, entry)
+            latest_key = version.key
+    return latest
@@ -0,0 +1,103 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+
+import fsutil
+
+# Extracted files live once in a content-addressed store and version
+# trees are made of links into it, so files that did not change between
+# versions cost neither writes nor space.
+STORE_DIR = fsutil.SOFTWARE_ROOT / '.store'
+OBJECTS_DIR = STORE_DIR / 'objects'
+ENABLED = os.environ.get('SOFTWARE_STORE', '1') != '0'
+# 'hardlink', or 'reflink' on filesystems that support it (btrfs, XFS)
+LINK_MODE = os.environ.get('SOFTWARE_STORE_LINK', 'hardlink')
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# linux/fs.h
+FICLONE = 0x40049409
+
+_buffers = threading.local()
+
+
+def object_path(digest, mode):
+    # Hard links share permissions, so the mode is part of the key
+    name = f'{digest}-{mode & 0o7777:o}'
+    return OBJECTS_DIR / name[:2] / name
+
+
+def _temp_path(directory):
+    return directory / f'.tmp-{os.getpid()}-{threading.get_ident()}'
+
+
+def _publish(temp, target, mode, mtime):
+    os.chmod(temp, mode)
+    os.utime(temp, (mtime, mtime))
+    # Another thread may have stored the same content meanwhile, either copy wins
+    os.replace(temp, target)
+
+
+def store_bytes(payload, mode, mtime):
+    target = object_path(hashlib.sha256(payload).hexdigest(), mode)
+    if target.exists():
+        return target
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = _temp_path(target.parent)
+    temp.write_bytes(payload)
+    _publish(temp, target, mode, mtime)
+    return target
+
+
+def store_stream(source, mode, mtime):
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = memoryview(bytearray(COPY_BUFFER_SIZE))
+
+    # The digest is only known at the end, so large members are written
+    # to a temporary file first and dropped if the object already exists
+    OBJECTS_DIR.mkdir(parents=True, exist_ok=True)
+    temp = _temp_path(OBJECTS_DIR)
+    hasher = hashlib.sha256()
+    with temp.open('wb') as target:
+        while count := source.readinto(buffer):
+            hasher.update(buffer[:count])
+            target.write(buffer[:count])
+
+    target = object_path(hasher.hexdigest(), mode)
+    if target.exists():
+        temp.unlink()
+        return target
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    _publish(temp, target, mode, mtime)
+    return target
+
+
+def _reflink(source, path):
+    with source.open('rb') as original, path.open('wb') as clone:
+        fcntl.ioctl(clone.fileno(), FICLONE, original.fileno())
+    shutil.copystat(source, path)
+
+
+def materialise(source, path):
+    if path.is_symlink() or path.exists():
+        path.unlink()
+
+    if LINK_MODE == 'reflink':
+        try:
+            _reflink(source, path)
+            return
+        except OSError:
+            path.unlink(missing_ok=True)
+
+    try:
+        os.link(source, path)
+    except OSError as e:
+        # Store on another filesystem, or too many links to one object
+        if e.errno not in (errno.EXDEV, errno.EMLINK):
+            raise
+        shutil.copy2(source, path)
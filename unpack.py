@@ -0,0 +1,317 @@
+import contextlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import checksums
+import decompress
+import download
+import fsutil
+import metrics
+import store
+
+# Written into a tree as its last file, a tree that has one is complete
+MARKER_NAME = '.complete.json'
+
+# Extract archives while they download instead of after
+STREAM = os.environ.get('SOFTWARE_STREAM_EXTRACT', '1') != '0'
+
+# Members are copied through one reusable buffer per thread, so peak
+# memory stays flat however large the binaries in the archive are
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Decompression stays sequential, file writes go to a pool of workers
+WRITE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Members up to this size are read into memory and handed to a worker,
+# larger ones are copied straight from the archive by the reading thread
+SMALL_MEMBER_SIZE = 1024 * 1024
+# Upper bound on payload bytes waiting for a worker
+MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+COMPRESSION = {
+    '.gz': 'gz',
+    '.tgz': 'gz',
+    '.xz': 'xz',
+    '.bz2': 'bz2',
+    '.zst': 'zst',
+    '.tar': '',
+}
+
+
+def compression(path):
+    try:
+        return COMPRESSION[path.suffix]
+    except KeyError:
+        raise ValueError(f'{path.name}: unknown archive type')
+
+
+_buffers = threading.local()
+
+
+def copy_file(source, path):
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = memoryview(bytearray(COPY_BUFFER_SIZE))
+
+    with path.open('wb') as target:
+        while count := source.readinto(buffer):
+            target.write(buffer[:count])
+
+
+def set_metadata(path, member):
+    path.chmod(member.mode)
+    # Path.utime(member.mtime) does not yet exists
+    os.utime(path, (member.mtime, member.mtime))
+
+
+def write_payload(path, payload, member):
+    if store.ENABLED:
+        store.materialise(store.store_bytes(payload, member.mode, member.mtime), path)
+        return
+    # Never write through a link into the store
+    path.unlink(missing_ok=True)
+    path.write_bytes(payload)
+    set_metadata(path, member)
+
+
+def write_stream(path, content, member):
+    if store.ENABLED:
+        store.materialise(store.store_stream(content, member.mode, member.mtime), path)
+        return
+    path.unlink(missing_ok=True)
+    copy_file(content, path)
+    set_metadata(path, member)
+
+
+class PendingBytes:
+    # Keeps the reader from decompressing far ahead of the writers
+    def __init__(self, limit):
+        self.limit = limit
+        self.pending = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        with self.condition:
+            # A single payload larger than the limit still gets through
+            self.condition.wait_for(lambda: self.pending == 0 or self.pending + size <= self.limit)
+            self.pending += size
+
+    def release(self, size):
+        with self.condition:
+            self.pending -= size
+            self.condition.notify_all()
+
+
+def staging_paths(root):
+    # Where a tree is extracted before it's complete, and its journal
+    return root.with_name(f'.{root.name}.staging'), root.with_name(f'.{root.name}.journal')
+
+
+class Staging:
+    # A tree is extracted next to its final location and renamed into place
+    # once complete. The journal lists the members already written, so an
+    # interrupted extraction picks up where it stopped.
+    def __init__(self, root):
+        self.root = root
+        self.path, self.journal_path = staging_paths(root)
+        self.lock = threading.Lock()
+        self.completed = set()
+        # What the completion marker records, filled in by the extraction
+        self.summary = {}
+
+        if self.path.exists() and self.journal_path.exists():
+            with self.journal_path.open() as journal:
+                for line in journal:
+                    # A line cut short by the interruption didn't complete
+                    with contextlib.suppress(ValueError):
+                        self.completed.add(json.loads(line))
+            print(f'{root.name}: resuming, {len(self.completed)} members already extracted')
+        else:
+            self.discard()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.journal = self.journal_path.open('a')
+
+    def done(self, name):
+        return name in self.completed
+
+    def record(self, name):
+        with self.lock:
+            self.journal.write(json.dumps(name) + '\n')
+            self.journal.flush()
+
+    def close(self):
+        if not self.journal.closed:
+            self.journal.close()
+
+    def commit(self, **marker):
+        self.close()
+        # The marker goes in before the rename, so it arrives with the tree
+        fsutil.write_json(self.path / MARKER_NAME, marker)
+        fsutil.replace_tree(self.path, self.root)
+        self.journal_path.unlink(missing_ok=True)
+
+    def discard(self):
+        if hasattr(self, 'journal'):
+            self.close()
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.journal_path.unlink(missing_ok=True)
+
+
+@contextlib.contextmanager
+def staged(root):
+    staging = Staging(root)
+    try:
+        yield staging
+    except download.ChecksumMismatch:
+        # Whatever was extracted came from a bad artifact
+        staging.discard()
+        raise
+    except BaseException:
+        staging.close()
+        raise
+    staging.commit(**staging.summary)
+
+
+def is_complete(root, artifact=None):
+    # A tree extracted from another archive than the verified one beside
+    # it (a release re-published under the same version) isn't the one
+    # wanted anymore. Without both digests the marker is taken at its word.
+    try:
+        marker = json.loads((root / MARKER_NAME).read_text())
+    except (OSError, ValueError):
+        return False
+    if artifact is None or marker.get('sha256') is None:
+        return True
+    verified = checksums.verified_digest(artifact)
+    return verified is None or verified == marker['sha256']
+
+
+class UnsafeMember(Exception):
+    pass
+
+
+def member_path(name, root, replace_prefix):
+    # Where a member (or a hard link's source) goes. Absolute names, '..'
+    # and names outside the prefix would land outside root and are refused.
+    path = os.path.normpath(name.replace(replace_prefix, str(root), 1))
+    root = os.path.normpath(root)
+    if not os.path.isabs(path) or os.path.commonpath([root, path]) != root:
+        raise UnsafeMember(f'{name}: outside {root}')
+    return Path(path)
+
+
+def extract_all(archive, root, replace_prefix, workers=WRITE_WORKERS, journal=None):
+    # Returns the number of members and the bytes of file content
+    members = 0
+    total_bytes = 0
+    files_written = 0
+    bytes_written = 0
+    directories = []
+    links = []
+    created = set()
+    pending = PendingBytes(MAX_PENDING_BYTES)
+    futures = []
+
+    def make_dirs(path):
+        if path not in created:
+            path.mkdir(parents=True, exist_ok=True)
+            created.add(path)
+
+    with ThreadPoolExecutor(workers, thread_name_prefix='unpack') as pool:
+        for member in archive:
+            path = member_path(member.name, root, replace_prefix)
+            members += 1
+
+            if member.isdir():
+                # Directories exist before any worker writes into them
+                make_dirs(path)
+                directories.append((path, member))
+
+            elif member.isfile():
+                total_bytes += member.size
+                if journal is not None and journal.done(member.name):
+                    continue
+
+                make_dirs(path.parent)
+                files_written += 1
+                bytes_written += member.size
+                content = archive.extractfile(member)
+                if member.size <= SMALL_MEMBER_SIZE:
+                    payload = content.read()
+                    pending.acquire(len(payload))
+                    future = pool.submit(write_payload, path, payload, member)
+                    future.add_done_callback(lambda _, size=len(payload): pending.release(size))
+                    if journal is not None:
+                        future.add_done_callback(
+                            lambda future, name=member.name: future.exception() or journal.record(name)
+                        )
+                    futures.append(future)
+                else:
+                    write_stream(path, content, member)
+                    if journal is not None:
+                        journal.record(member.name)
+
+            elif member.issym() or member.islnk():
+                if member.islnk():
+                    # Refused before anything is linked, not halfway through
+                    member_path(member.linkname, root, replace_prefix)
+                make_dirs(path.parent)
+                links.append((path, member))
+
+            else:
+                print(f'{member.name}: Unknown member type')
+
+    for future in futures:
+        future.result()
+
+    # Links last, so hard link targets are complete
+    for path, member in links:
+        if member.issym():
+            fsutil.replace_symlink(path, member.linkname)
+            continue
+        if path.is_symlink() or path.exists():
+            path.unlink()
+        os.link(member_path(member.linkname, root, replace_prefix), path)
+
+    # Directory metadata last, writing into a directory changes its mtime
+    for path, member in reversed(directories):
+        set_metadata(path, member)
+
+    metrics.count('files_written', files_written)
+    metrics.count('bytes_written', bytes_written)
+    return members, total_bytes
+
+
+def needs_download(url, path):
+    # With streaming, the download happens during extraction. That reads
+    # over one connection, an archive big enough to be fetched over
+    # several is faster saved first and extracted from disk.
+    if path.exists():
+        return False
+    return not STREAM or download.segmented(url, path)
+
+
+@contextlib.contextmanager
+def open_tarball(url, path, checksum=None, mirror=True):
+    with contextlib.ExitStack() as stack:
+        if path.exists():
+            source = stack.enter_context(path.open('rb'))
+        else:
+            # The expected digest is fetched while the archive streams in
+            source = stack.enter_context(download.open_stream(
+                url,
+                path,
+                sha256=checksums.start(checksum),
+                on_verified=lambda digest: checksums.record(path, digest, url),
+                mirror=mirror,
+            ))
+
+        # Decompression runs in a separate (often multi-threaded) process
+        # where possible, tarfile only ever sees a plain tar stream
+        stream = stack.enter_context(decompress.open(source, compression(path)))
+        yield stack.enter_context(tarfile.open(fileobj=stream, mode='r|'))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+import argparse
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import catalogue
+import engine
+import github
+import retention
+from pipeline import Pipeline, IO_WORKERS, CPU_WORKERS
+
+# With --stats, how often to print each stage's queue while updaters run
+DEPTHS_SECONDS = 2
+
+
+def check_one(tool):
+    # (installed, latest, whether a newer release is available)
+    installed, latest = tool.installed_version(), tool.latest_version()
+    if installed is None:
+        return installed, latest, False
+
+    # latest_version() has just refreshed a catalogued tool's releases,
+    # the index on sort_key finds those that outrank the install
+    if tool.catalogued and catalogue.ENABLED:
+        try:
+            return installed, latest, bool(catalogue.newer(tool.name, installed))
+        except ValueError:
+            # Not a semantic version, the text has to do
+            pass
+    return installed, latest, installed.strip() != latest.strip()
+
+
+def check(tools, jobs):
+    # Read only: resolve every tool concurrently and compare it with what
+    # the symlinks point at, nothing is downloaded
+    start = time.monotonic()
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(check_one, tool): name
+            for name, tool in tools.items()
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future
+
+    stale = 0
+    print(f'{"tool":<12} {"installed":<24} {"latest":<24} status')
+    for name in tools:
+        error = results[name].exception()
+        if error is not None:
+            print(f'{name:<12} {"":<24} {"":<24} failed: {error}')
+            stale += 1
+            continue
+
+        installed, latest, outdated = results[name].result()
+        if installed is None:
+            status = 'not installed'
+        elif outdated:
+            status = 'outdated'
+        else:
+            status = 'up to date'
+        if status != 'up to date':
+            stale += 1
+        print(f'{name:<12} {installed or "-":<24} {latest.strip():<24} {status}')
+
+    print(f'checked {len(tools)} tools in {time.monotonic() - start:.2f}s')
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run every updater concurrently')
+    parser.add_argument('tools', nargs='*', help='only run these updaters (e.g. go node)')
+    parser.add_argument('-j', '--jobs', type=int, default=IO_WORKERS, help='network workers')
+    parser.add_argument('--cpu-jobs', type=int, default=CPU_WORKERS, help='extraction workers')
+    parser.add_argument('--stats', action='store_true', help='print per-stage timings')
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help="report outdated tools without downloading anything, exits 1 if any are",
+    )
+    parser.add_argument(
+        '--gc',
+        action='store_true',
+        help='remove old versions and archives the retention policy does not keep, instead of updating',
+    )
+    parser.add_argument('--budget', default=retention.BUDGET, help='with --gc, a size SOFTWARE_ROOT should fit in (e.g. 20G)')
+    parser.add_argument('--dry-run', action='store_true', help='with --gc, only report what would be removed')
+    args = parser.parse_args()
+
+    names = engine.names()
+    if args.tools:
+        wanted = {tool.removeprefix('update_') for tool in args.tools}
+        unknown = wanted - set(names)
+        if unknown:
+            parser.error(f'unknown tools: {", ".join(sorted(unknown))}')
+        names = [name for name in names if name in wanted]
+
+    tools = {name: engine.tool(name) for name in names}
+
+    if args.gc:
+        try:
+            budget = retention.parse_size(args.budget) if args.budget else None
+        except ValueError as e:
+            parser.error(str(e))
+        retention.collect(list(tools.values()), budget, args.dry_run)
+        return
+
+    # Resolve every GitHub hosted tool with one query instead of one each
+    github.register(*(tool.repo for tool in tools.values() if tool.repo))
+
+    if args.check:
+        sys.exit(1 if check(tools, args.jobs) else 0)
+
+    failures = {}
+    with Pipeline(io_workers=args.jobs, cpu_workers=args.cpu_jobs) as pipeline:
+        futures = {
+            pipeline.submit(name, tool): name
+            for name, tool in tools.items()
+        }
+        pending = set(futures)
+        printed = time.monotonic()
+        while pending:
+            done, pending = wait(pending, timeout=DEPTHS_SECONDS if args.stats else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                error = future.exception()
+                if error is not None:
+                    failures[name] = ''.join(traceback.format_exception(error))
+                    print(f'{name}: failed')
+                else:
+                    print(f'{name}: done')
+
+            if args.stats and pending and time.monotonic() - printed >= DEPTHS_SECONDS:
+                printed = time.monotonic()
+                print('queued/running: ' + ', '.join(
+                    f'{stage} {queued}/{running}' for stage, (queued, running) in pipeline.depths().items()
+                ))
+
+    if args.stats:
+        pipeline.report()
+
+    for name, error in failures.items():
+        print(f'\n=== {name}\n{error}', file=sys.stderr)
+
+    print(f'{len(names) - len(failures)}/{len(names)} updaters succeeded')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()